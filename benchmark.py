@@ -0,0 +1,234 @@
+
+"""Offline load test for the slash command handlers.
+
+Drives the real command callbacks from bot.py with fake interactions
+against a throwaway database and prints JSON results, e.g.
+
+    python benchmark.py --users 2000 --commands 10 --concurrency 500 -o before.json
+
+Latency is measured per command invocation and split into time spent
+awaiting db.read()/db.write() and everything else (handler time).
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+COMMANDS = ("pull", "daily", "weekly", "inventory", "achievements")
+DEFAULT_MIX = "pull=70,daily=5,weekly=5,inventory=10,achievements=10"
+
+_db_time = contextvars.ContextVar("db_time")
+
+
+# --- Fake Discord objects ---
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"bench{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeResponse:
+    def __init__(self, api_latency):
+        self.api_latency = api_latency
+        self.sent = 0
+
+    async def _call(self):
+        self.sent += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    async def send_message(self, *args, **kwargs):
+        await self._call()
+
+    async def defer(self, *args, **kwargs):
+        await self._call()
+
+    async def edit_message(self, *args, **kwargs):
+        await self._call()
+
+    def is_done(self):
+        return self.sent > 0
+
+
+class FakeFollowup(FakeResponse):
+    async def send(self, *args, **kwargs):
+        await self._call()
+
+
+class FakeInteraction:
+    def __init__(self, user_id, api_latency=0.0):
+        self.user = FakeUser(user_id)
+        self.response = FakeResponse(api_latency)
+        self.followup = FakeFollowup(api_latency)
+
+    async def edit_original_response(self, *args, **kwargs):
+        await self.followup._call()
+
+
+# --- Instrumentation ---
+
+def time_db_calls(db):
+    """Wrap db.read/db.write so time awaited on them is charged to the running command."""
+    def wrap(method):
+        async def timed(fn, *args):
+            start = time.perf_counter()
+            try:
+                return await method(fn, *args)
+            finally:
+                spent = _db_time.get(None)
+                if spent is not None:
+                    spent[0] += time.perf_counter() - start
+        return timed
+    db.read = wrap(db.read)
+    db.write = wrap(db.write)
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples):
+    # samples: list of (total, db) in seconds
+    result = {"count": len(samples)}
+    for name, values in (("total", [s[0] for s in samples]), ("db", [s[1] for s in samples]), ("handler", [s[0] - s[1] for s in samples])):
+        values.sort()
+        result[f"{name}_ms"] = {
+            "mean": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "p50": round(percentile(values, 50) * 1000, 3),
+            "p95": round(percentile(values, 95) * 1000, 3),
+            "p99": round(percentile(values, 99) * 1000, 3),
+            "max": round(values[-1] * 1000, 3) if values else 0.0,
+        }
+    return result
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"unknown command {name!r}, expected one of {', '.join(COMMANDS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# --- Workload ---
+
+async def run_workload(bot, core, args):
+    rng = random.Random(args.seed)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    # Each simulated user issues its commands in order; users run concurrently
+    plans = [(1_000_000 + u, rng.choices(names, weights, k=args.commands)) for u in range(args.users)]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def invoke(user_id, name):
+        interaction = FakeInteraction(user_id, args.api_latency_ms / 1000)
+        command = getattr(bot, name)
+        call_args = (args.pull_count,) if name == "pull" else ()
+        spent = [0.0]
+        _db_time.set(spent)
+        start = time.perf_counter()
+        try:
+            await command.callback(interaction, *call_args)
+        except Exception:
+            errors[name] += 1
+            return
+        samples[name].append((time.perf_counter() - start, spent[0]))
+
+    async def run_user(user_id, plan):
+        for name in plan:
+            async with gate:
+                # Own task so the db timer is not shared with other commands
+                await asyncio.create_task(invoke(user_id, name))
+
+    core.write_behind.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_user(user_id, plan) for user_id, plan in plans))
+    elapsed = time.perf_counter() - start
+    flush_start = time.perf_counter()
+    await core.write_behind.close()
+    drain = time.perf_counter() - flush_start
+
+    total = sum(len(s) for s in samples.values())
+    return {
+        "config": {
+            "users": args.users,
+            "commands_per_user": args.commands,
+            "concurrency": args.concurrency,
+            "pull_count": args.pull_count,
+            "api_latency_ms": args.api_latency_ms,
+            "mix": args.mix,
+            "seed": args.seed,
+            "flush_window_ms": core.FLUSH_WINDOW_MS,
+            "flush_max_events": core.FLUSH_MAX_EVENTS,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "final_flush_s": round(drain, 3),
+        "commands": total,
+        "errors": sum(errors.values()),
+        "throughput_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "pulls_per_s": round(len(samples.get("pull", ())) * args.pull_count / elapsed, 1) if elapsed else 0.0,
+        "overall": summarize([s for values in samples.values() for s in values]),
+        "per_command": {name: dict(summarize(values), errors=errors[name]) for name, values in samples.items()},
+        "write_behind": core.write_behind.stats(),
+    }
+
+
+def main_entry():
+    parser = argparse.ArgumentParser(description="Load test the slash command handlers against a temporary database.")
+    parser.add_argument("--users", type=int, default=1000, help="simulated users (default 1000)")
+    parser.add_argument("--commands", type=int, default=10, help="commands issued by each user (default 10)")
+    parser.add_argument("--concurrency", type=int, default=200, help="commands in flight at once (default 200)")
+    parser.add_argument("--pull-count", type=int, default=1, help="count argument passed to /pull (default 1)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"command weights (default {DEFAULT_MIX})")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="simulated Discord API round trip per response")
+    parser.add_argument("--seed", type=int, default=1, help="workload seed")
+    parser.add_argument("--keep-db", action="store_true", help="keep the temporary database and print its path")
+    parser.add_argument("-o", "--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rng-bench-")
+    # core.py opens the database at import time, so point it at the scratch copy first
+    os.environ["RNG_DB_PATH"] = os.path.join(workdir, "bench.db")
+    import bot
+    import core
+    time_db_calls(core.db)
+    try:
+        results = asyncio.run(run_workload(bot, core, args))
+    finally:
+        core.db.close()
+        if args.keep_db:
+            print(f"Database kept at {os.environ['RNG_DB_PATH']}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main_entry()
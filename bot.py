@@ -0,0 +1,667 @@
+
+"""The Discord bot: slash commands and the gateway client. Game state lives in core.py."""
+
+from metrics import startup
+import discord
+from discord.ext import commands
+import asyncio
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import signal
+import time
+from typing import Literal
+
+startup.mark("discord_import")
+
+from core import (
+    db, catalogue, rng_stream, write_behind, user_states, leaderboards, LEADERBOARD_TITLES,
+    claim_reward, get_user_achievements, reload_catalogue, poll_catalogue, poll_user_data,
+    get_meta, set_meta, record_pulls, summarize_pulls, get_inventory,
+    get_inventory_details, get_pulls, refresh_leaderboards, poll_leaderboards, get_user_ranks,
+    invalidate_user_states, drop_rate_report, get_observed_drops,
+)
+from catalogue import delete_item, insert_item, update_item_rarity
+from players import give_item, reset_user_data, set_pulls
+from game import ACHIEVEMENTS, RARITY_ORDER
+from rng import draw_items_async
+from images import ImageCache, is_remote
+from bulk import apply_bulk, failures_csv, parse_bulk
+from logconfig import PULL_LOGGER, log_event
+from metrics import metrics, instrument_tree, count_api_calls, write_metrics_periodically, serve_metrics, METRICS_PORT
+
+log = logging.getLogger("rng.bot")
+pull_log = logging.getLogger(PULL_LOGGER)
+admin_log = logging.getLogger("rng.admin")
+
+_achievement_embeds = {}
+
+def achievement_embed(name, desc):
+    # The same for everyone, so each one is built once
+    embed = _achievement_embeds.get(name)
+    if embed is None:
+        embed = _achievement_embeds[name] = discord.Embed(title=f"🏅 Achievement Unlocked: {name}", description=desc, color=0xffd700)
+    return embed
+
+
+# --- Bot setup ---
+intents = discord.Intents.default()
+bot = discord.Client(intents=intents)
+tree = discord.app_commands.CommandTree(bot)
+
+# --- Daily/Weekly Rewards Commands ---
+
+@tree.command(name="daily", description="Claim your daily login reward!")
+async def daily(interaction: discord.Interaction):
+    user_id = interaction.user.id
+    today = datetime.datetime.now().date()
+    coins = await db.write(claim_reward, user_id, str(interaction.user), "last_daily", str(today), 100)
+    if coins is None:
+        embed = discord.Embed(title="Daily Reward", description="You have already claimed your daily reward today!", color=0x00ccff)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    log_event(log, "reward", user_id=user_id, kind="daily", amount=100, coins=coins)
+    embed = discord.Embed(title="Daily Reward", description=f"You claimed 100 coins! Total coins: {coins}", color=0x00ccff)
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="weekly", description="Claim your weekly login reward!")
+async def weekly(interaction: discord.Interaction):
+    user_id = interaction.user.id
+    now = datetime.datetime.now().isocalendar()
+    week_str = f"{now[0]}-W{now[1]}"
+    coins = await db.write(claim_reward, user_id, str(interaction.user), "last_weekly", week_str, 500)
+    if coins is None:
+        embed = discord.Embed(title="Weekly Reward", description="You have already claimed your weekly reward!", color=0x00ccff)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    log_event(log, "reward", user_id=user_id, kind="weekly", amount=500, coins=coins)
+    embed = discord.Embed(title="Weekly Reward", description=f"You claimed 500 coins! Total coins: {coins}", color=0x00ccff)
+    await interaction.response.send_message(embed=embed)
+
+
+# --- Admin user ID ---
+ADMIN_USER_ID = 953772289311248464
+def is_admin(interaction):
+    return interaction.user.id == ADMIN_USER_ID
+
+# --- Item images ---
+# Local image files are uploaded once and their attachment URLs reused (see images.py)
+images = ImageCache(db)
+
+async def resolve_image(image):
+    return await images.resolve(bot, image)
+
+async def defer_for_image(interaction, image):
+    # The first showing of a local image hashes, thumbnails and uploads it, which can take
+    # longer than Discord's 3 s window: acknowledge first and edit the result in
+    if interaction.response.is_done() or images.is_ready(image):
+        return False
+    await interaction.response.defer()
+    return True
+
+# --- Item name autocomplete ---
+# Answered from the catalogue's in-memory name index: no SQL per keystroke
+async def item_name_autocomplete(interaction: discord.Interaction, current: str):
+    snapshot = catalogue.current
+    if snapshot is None:
+        return []
+    # Choice names are capped at 100 characters by Discord
+    return [discord.app_commands.Choice(name=item[:100], value=item) for item in snapshot.complete(current)]
+
+# --- Item info command for Discord ---
+@tree.command(name="iteminfo", description="Show info about an item.")
+@discord.app_commands.describe(item="Item name")
+@discord.app_commands.autocomplete(item=item_name_autocomplete)
+async def iteminfo(interaction: discord.Interaction, item: str):
+    info = catalogue.current.get(item)
+    if not info:
+        embed = discord.Embed(title="Item Info", description=f"Item '{item}' not found.", color=0xff5555)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    embed = discord.Embed(title=f"{item} ({info.rarity})", description=info.description or "No description.", color=0x00ccff)
+    deferred = await defer_for_image(interaction, info.image)
+    url, file = await resolve_image(info.image)
+    if url:
+        embed.set_image(url=url)
+    if deferred:
+        await interaction.edit_original_response(embed=embed, attachments=[file] if file else discord.utils.MISSING)
+    else:
+        await interaction.response.send_message(embed=embed, files=[file] if file else discord.utils.MISSING)
+@tree.command(name="add_item", description="[ADMIN] Add a new item to the item pool.")
+@discord.app_commands.describe(item="Item name", rarity="Rarity")
+@discord.app_commands.autocomplete(item=item_name_autocomplete)
+async def add_item(interaction: discord.Interaction, item: str, rarity: str):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    if not await db.write(insert_item, item, rarity):
+        embed = discord.Embed(title="Error", description="Item already exists.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    await reload_catalogue()
+    log_event(admin_log, "add_item", admin_id=interaction.user.id, item=item, rarity=rarity)
+    embed = discord.Embed(title="Item Added", description=f"Added {item} ({rarity}) to the item pool.", color=0x00ccff)
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="remove_item", description="[ADMIN] Remove an item from the item pool.")
+@discord.app_commands.describe(item="Item name")
+@discord.app_commands.autocomplete(item=item_name_autocomplete)
+async def remove_item(interaction: discord.Interaction, item: str):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    if not await db.write(delete_item, item):
+        embed = discord.Embed(title="Error", description=f"Item '{item}' not found in item pool.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    await reload_catalogue()
+    log_event(admin_log, "remove_item", admin_id=interaction.user.id, item=item)
+    embed = discord.Embed(title="Item Removed", description=f"Removed {item} from the item pool.", color=0x00ccff)
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="edit_item_rarity", description="[ADMIN] Edit the rarity of an item.")
+@discord.app_commands.describe(item="Item name", rarity="New rarity")
+@discord.app_commands.autocomplete(item=item_name_autocomplete)
+async def edit_item_rarity(interaction: discord.Interaction, item: str, rarity: str):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    if not await db.write(update_item_rarity, item, rarity):
+        embed = discord.Embed(title="Error", description=f"Item '{item}' not found in item pool.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    await reload_catalogue()
+    log_event(admin_log, "edit_item_rarity", admin_id=interaction.user.id, item=item, rarity=rarity)
+    embed = discord.Embed(title="Item Updated", description=f"Updated {item} to rarity {rarity}.", color=0x00ccff)
+    await interaction.response.send_message(embed=embed)
+
+# --- Helper functions ---
+
+
+# --- Command sync ---
+# Syncing is slow and rate limited, so it only happens when the command definitions change
+# (or with --force-sync), and at most once per process rather than on every reconnect.
+force_sync = False
+commands_synced = False
+
+def command_tree_hash():
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c.get("type", 1), c["name"]))
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).digest()
+    # 63 bits so it fits the meta table's integer column
+    return int.from_bytes(digest[:8], "big") >> 1
+
+async def sync_commands():
+    # Keyed by application so switching tokens to another bot still syncs
+    key = f"command_tree_hash:{bot.application_id}"
+    current = command_tree_hash()
+    if not force_sync and await db.read(get_meta, key) == current:
+        log.info("Slash commands unchanged, skipping sync.")
+        return
+    synced = await tree.sync()
+    await db.write(set_meta, key, current)
+    log.info("Synced %d slash commands.", len(synced))
+
+# --- Bot Events ---
+@bot.event
+async def on_ready():
+    global commands_synced
+    log.info("Logged in as %s", bot.user)
+    if "ready" not in startup.phases:
+        startup.mark("ready")
+        log_event(log, "startup", **startup.report())
+    if commands_synced:
+        return  # Reconnect: the commands were already checked this process
+    try:
+        await sync_commands()
+        commands_synced = True
+    except Exception:
+        log.exception("Failed to sync commands")
+
+# DM welcome/help message
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    if isinstance(message.channel, discord.DMChannel):
+        help_text = (
+            "👋 Hi! I'm Tactas RNG. You can use all my slash commands here in DMs, just like in a server!\n"
+            "Try /pull, /inventory, /achievements, and more.\n"
+            "If you need help, use /help or invite me to your server."
+        )
+        await message.channel.send(help_text)
+
+
+MAX_PULLS_PER_COMMAND = 100
+
+# Discord allows 10 embeds per message: header, result, and up to 8 unlocks
+MAX_ACHIEVEMENT_EMBEDS = 8
+# If the DB side of a pull takes longer than this, defer and edit the result in (0 = never defer)
+PULL_DEFER_MS = int(os.getenv("RNG_PULL_DEFER_MS", "1000"))
+
+def item_embed(snapshot, item, rarity):
+    # Prebuilt per item and catalogue version; description and image come from the snapshot the item was drawn from.
+    # Local images are left off: their URL comes from the image cache and can change.
+    key = ("item_embed", item)
+    embed = snapshot.cache.get(key)
+    if embed is None:
+        info = snapshot.get(item)
+        embed = discord.Embed(title="Item", description=f"**{item}**", color=0x00ffcc)
+        embed.add_field(name="Rarity", value=f"`{rarity}`", inline=True)
+        if info and info.description:
+            embed.add_field(name="Description", value=info.description, inline=False)
+        if info and info.image and is_remote(info.image):
+            embed.set_image(url=info.image)
+        embed.set_footer(text="Good luck on your next pull!")
+        snapshot.cache[key] = embed
+    return embed
+
+@tree.command(name="pull", description="Pull a random item!")
+@discord.app_commands.describe(count=f"Number of pulls (1-{MAX_PULLS_PER_COMMAND}, default 1)")
+async def pull(interaction: discord.Interaction, count: discord.app_commands.Range[int, 1, MAX_PULLS_PER_COMMAND] = 1):
+    user_id = interaction.user.id
+    username = str(interaction.user)
+    snapshot = catalogue.current
+    sampler = snapshot.sampler
+    if sampler is None:
+        embed = discord.Embed(title="🎲 RNG Pull!", description="The item pool is empty.", color=0xff5555)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    stream_id, rng_pos, draws = await draw_items_async(sampler, rng_stream, count)
+    # --- Achievement tracking ---
+    deferred = False
+    if PULL_DEFER_MS and user_id not in user_states:
+        # Only an uncached user can wait on the database here
+        record = asyncio.ensure_future(record_pulls(user_id, username, draws, snapshot, stream_id, rng_pos))
+        done, _ = await asyncio.wait({record}, timeout=PULL_DEFER_MS / 1000)
+        if not done:
+            # Acknowledge inside Discord's 3 s window, then edit the result in
+            await interaction.response.defer()
+            deferred = True
+        counts, awarded = await record
+    else:
+        counts, awarded = await record_pulls(user_id, username, draws, snapshot, stream_id, rng_pos)
+    # Header, result and unlocks all go out in one message
+    file = None
+    if count > 1:
+        embeds = [discord.Embed(title=f"🎲 RNG Pull x{count}!", description=f"{interaction.user.mention} pulled:", color=0x00ffcc)]
+        embed = discord.Embed(title="Items", color=0x00ffcc)
+        lines = [f"**{item}** `{rarity}` x{amount}" for (item, rarity), amount in summarize_pulls(counts)]
+        embed.description = "\n".join(lines)
+        embed.set_footer(text="Good luck on your next pull!")
+        embeds.append(embed)
+    else:
+        item, rarity = draws[0]
+        embed = item_embed(snapshot, item, rarity)
+        info = snapshot.get(item)
+        if info and info.image and not is_remote(info.image):
+            deferred = await defer_for_image(interaction, info.image) or deferred
+            url, file = await resolve_image(info.image)
+            if url:
+                embed = embed.copy()
+                embed.set_image(url=url)
+        embeds = [discord.Embed(title="🎲 RNG Pull!", description=f"{interaction.user.mention} pulled:", color=0x00ffcc), embed]
+    embeds.extend(achievement_embed(name, desc) for _, name, desc in awarded[:MAX_ACHIEVEMENT_EMBEDS])
+    if deferred:
+        await interaction.edit_original_response(embeds=embeds, attachments=[file] if file else discord.utils.MISSING)
+    else:
+        await interaction.response.send_message(embeds=embeds, files=[file] if file else discord.utils.MISSING)
+    log_event(pull_log, "pull", user_id=user_id, user=username, count=count,
+              items={item: amount for (item, _), amount in counts.items()}, achievements=[aid for aid, _, _ in awarded])
+# --- Achievements command ---
+@tree.command(name="achievements", description="View your achievements and badges!")
+async def achievements(interaction: discord.Interaction):
+    user_id = interaction.user.id
+    await write_behind.flush()
+    user_achievements = await db.read(get_user_achievements, user_id)
+    if not user_achievements:
+        embed = discord.Embed(title="Achievements", description="No achievements yet! Pull more items to unlock badges.", color=0x888888)
+        await interaction.response.send_message(embed=embed)
+        return
+    embed = discord.Embed(title=f"{interaction.user.display_name}'s Achievements", color=0xffd700)
+    for aid, name, desc, _ in ACHIEVEMENTS:
+        if aid in user_achievements:
+            embed.add_field(name=f"🏅 {name}", value=desc, inline=False)
+    await interaction.response.send_message(embed=embed)
+
+
+INVENTORY_PAGE_SIZE = 12  # Discord caps embeds at 25 fields
+INVENTORY_SORTS = {
+    "rarity": lambda row: (-(RARITY_ORDER.index(row[1]) if row[1] in RARITY_ORDER else -1), row[0]),
+    "name": lambda row: row[0].lower(),
+    "amount": lambda row: (-row[2], row[0]),
+}
+
+class InventoryView(discord.ui.View):
+    """Pages, sorts and filters an inventory that was fetched once, without going back to the database."""
+
+    def __init__(self, owner, rows):
+        super().__init__(timeout=180)
+        self.owner = owner
+        self.rows = rows
+        self.rarity = None
+        self.sort = "rarity"
+        self.page = 0
+        self._apply()
+        rarities = sorted(set(row[1] for row in rows), key=lambda r: RARITY_ORDER.index(r) if r in RARITY_ORDER else len(RARITY_ORDER))
+        self.rarity_select.options = [discord.SelectOption(label="All rarities", value="*", default=True)] + [
+            discord.SelectOption(label=rarity, value=rarity) for rarity in rarities[:24]
+        ]
+        self._update_buttons()
+
+    def _apply(self):
+        rows = self.rows if self.rarity is None else [row for row in self.rows if row[1] == self.rarity]
+        self.visible = sorted(rows, key=INVENTORY_SORTS[self.sort])
+        self.pages = max(1, -(-len(self.visible) // INVENTORY_PAGE_SIZE))
+        self.page = min(self.page, self.pages - 1)
+
+    def _update_buttons(self):
+        self.prev_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.pages - 1
+
+    def page_image(self):
+        # Show image of first item on the page if available
+        page_rows = self.visible[self.page * INVENTORY_PAGE_SIZE:(self.page + 1) * INVENTORY_PAGE_SIZE]
+        return next((row[4] for row in page_rows if row[4]), None)
+
+    async def render(self):
+        # The page embed plus the file to attach if its image is a local one without an uploaded URL yet
+        embed = self.build_embed()
+        url, file = await resolve_image(self.page_image())
+        if url:
+            embed.set_image(url=url)
+        return embed, file
+
+    def build_embed(self):
+        embed = discord.Embed(title=f"{self.owner.display_name}'s Inventory", color=0x00ccff)
+        page_rows = self.visible[self.page * INVENTORY_PAGE_SIZE:(self.page + 1) * INVENTORY_PAGE_SIZE]
+        for item, rarity, amount, description, _ in page_rows:
+            value = f"{rarity} x{amount}"
+            if description:
+                value += f"\n{description}"
+            embed.add_field(name=item, value=value[:1024], inline=True)
+        total = sum(row[2] for row in self.visible)
+        embed.set_footer(text=f"Page {self.page + 1}/{self.pages} · {len(self.visible)} distinct items · {total} total")
+        return embed
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.owner.id
+
+    async def _refresh(self, interaction):
+        self._update_buttons()
+        deferred = await defer_for_image(interaction, self.page_image())
+        embed, file = await self.render()
+        if deferred:
+            await interaction.edit_original_response(embed=embed, view=self, attachments=[file] if file else [])
+        else:
+            await interaction.response.edit_message(embed=embed, view=self, attachments=[file] if file else [])
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction, button):
+        self.page = max(0, self.page - 1)
+        await self._refresh(interaction)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        self.page = min(self.pages - 1, self.page + 1)
+        await self._refresh(interaction)
+
+    @discord.ui.select(placeholder="Sort by", options=[
+        discord.SelectOption(label="Sort by rarity", value="rarity", default=True),
+        discord.SelectOption(label="Sort by name", value="name"),
+        discord.SelectOption(label="Sort by amount", value="amount"),
+    ])
+    async def sort_select(self, interaction, select):
+        self.sort = select.values[0]
+        for option in select.options:
+            option.default = option.value == self.sort
+        self.page = 0
+        self._apply()
+        await self._refresh(interaction)
+
+    @discord.ui.select(placeholder="Filter by rarity")
+    async def rarity_select(self, interaction, select):
+        self.rarity = None if select.values[0] == "*" else select.values[0]
+        for option in select.options:
+            option.default = option.value == select.values[0]
+        self.page = 0
+        self._apply()
+        await self._refresh(interaction)
+
+@tree.command(name="inventory", description="View your inventory!")
+async def inventory(interaction: discord.Interaction):
+    user_id = interaction.user.id
+    await write_behind.flush()
+    rows = get_inventory_details(catalogue.current, await db.read(get_inventory, user_id))
+    if not rows:
+        embed = discord.Embed(title="Inventory", description=f"{interaction.user.mention} has no items yet!", color=0xff5555)
+        await interaction.response.send_message(embed=embed)
+        return
+    view = InventoryView(interaction.user, rows)
+    deferred = await defer_for_image(interaction, view.page_image())
+    embed, file = await view.render()
+    if deferred:
+        await interaction.edit_original_response(embed=embed, view=view, attachments=[file] if file else discord.utils.MISSING)
+    else:
+        await interaction.response.send_message(embed=embed, view=view, files=[file] if file else discord.utils.MISSING)
+
+
+@tree.command(name="stats", description="View your pull stats!")
+async def stats(interaction: discord.Interaction):
+    user_id = interaction.user.id
+    await write_behind.flush()
+    pulls = await db.read(get_pulls, user_id)
+    embed = discord.Embed(title="Pull Stats", color=0x99ff99)
+    embed.add_field(name="User", value=interaction.user.mention, inline=True)
+    embed.add_field(name="Total Pulls", value=str(pulls), inline=True)
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="leaderboard", description="View the top players!")
+@discord.app_commands.describe(board="What to rank by (default pulls)")
+async def leaderboard(interaction: discord.Interaction, board: Literal["pulls", "coins", "collection"] = "pulls"):
+    if board not in leaderboards:
+        await refresh_leaderboards()
+    refreshed_at, rows = leaderboards[board]
+    embed = discord.Embed(title=f"🏆 Leaderboard: {LEADERBOARD_TITLES[board]}", color=0xffd700)
+    if not rows:
+        embed.description = "No players yet!"
+    else:
+        embed.description = "\n".join(f"**#{idx}** {username or user_id} - {value or 0}" for idx, (user_id, username, value) in enumerate(rows, 1))
+    embed.set_footer(text=f"Updated {refreshed_at.strftime('%H:%M:%S')}")
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="rank", description="See where you stand on the leaderboards!")
+@discord.app_commands.describe(user="Player to look up (default you)")
+async def rank(interaction: discord.Interaction, user: discord.User = None):
+    user = user or interaction.user
+    await write_behind.flush()
+    ranks = await db.read(get_user_ranks, user.id)
+    embed = discord.Embed(title=f"{user.display_name}'s Rank", color=0xffd700)
+    if not ranks:
+        embed.description = "Not ranked yet! Pull some items first."
+    for board, title in LEADERBOARD_TITLES.items():
+        if board in ranks:
+            value, position = ranks[board]
+            embed.add_field(name=title, value=f"#{position} ({value})", inline=True)
+    if "collection" not in ranks and ranks:
+        embed.set_footer(text="Your collection score shows up a few seconds after your first pull.")
+    await interaction.response.send_message(embed=embed)
+
+# To run the bot, put your token in a .env file as DISCORD_TOKEN=your_token_here
+# To run the bot, put your token in a .env file as DISCORD_TOKEN=your_token_here
+@tree.command(name="admin_reset_data", description="[ADMIN] Reset all user and inventory data.")
+async def admin_reset_data(interaction: discord.Interaction):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    # Pulls still queued would otherwise be written back after the reset
+    await write_behind.flush()
+    await db.write(reset_user_data)
+    invalidate_user_states()
+    log_event(admin_log, "reset_data", level=logging.WARNING, admin_id=interaction.user.id)
+    embed = discord.Embed(title="Admin Action", description="All user and inventory data has been reset.", color=0xff8800)
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="admin_give_item", description="[ADMIN] Give an item to a user.")
+@discord.app_commands.describe(user_id="User ID to give item to", item="Item name", amount="Amount to give (default 1)")
+@discord.app_commands.autocomplete(item=item_name_autocomplete)
+async def admin_give_item(interaction: discord.Interaction, user_id: int, item: str, amount: int = 1):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    info = catalogue.current.get(item)
+    if not info:
+        embed = discord.Embed(title="Error", description="Item not found in item pool.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    rarity = info.rarity
+    await db.write(give_item, user_id, info.item_id, amount)
+    log_event(admin_log, "give_item", admin_id=interaction.user.id, user_id=user_id, item=item, rarity=rarity, amount=amount)
+    embed = discord.Embed(title="Admin Action", description=f"Gave {amount}x {item} ({rarity}) to user {user_id}.", color=0xff8800)
+    await interaction.response.send_message(embed=embed)
+
+@tree.command(name="admin_set_pulls", description="[ADMIN] Set a user's pull count.")
+@discord.app_commands.describe(user_id="User ID to set pulls for", pulls="Pull count")
+async def admin_set_pulls(interaction: discord.Interaction, user_id: int, pulls: int):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    await write_behind.flush()
+    await db.write(set_pulls, user_id, pulls)
+    # After the write, so a pull in between can't cache the old count again
+    invalidate_user_states([user_id])
+    log_event(admin_log, "set_pulls", admin_id=interaction.user.id, user_id=user_id, pulls=pulls)
+    embed = discord.Embed(title="Admin Action", description=f"Set pulls for user {user_id} to {pulls}.", color=0xff8800)
+    await interaction.response.send_message(embed=embed)
+
+# Bulk admin changes from an attached CSV (formats in bulk.py)
+BULK_MAX_BYTES = int(os.getenv("RNG_BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+BULK_FAILURES_SHOWN = 10
+
+@tree.command(name="admin_bulk", description="[ADMIN] Give items, set pulls or grant rewards to every user in a CSV.")
+@discord.app_commands.describe(action="What to apply to each row", file="CSV: user_id,item[,amount] | user_id,pulls | user_id")
+async def admin_bulk(interaction: discord.Interaction, action: Literal["give_item", "set_pulls", "daily_reward", "weekly_reward"], file: discord.Attachment):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    if file.size > BULK_MAX_BYTES:
+        embed = discord.Embed(title="Error", description=f"The file is larger than {BULK_MAX_BYTES // 1024} KB.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        embed = discord.Embed(title="Error", description="The file is not UTF-8 text.", color=0xff0000)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        return
+    rows, failures = parse_bulk(action, text)
+    total = len(rows) + len(failures)
+    if action == "set_pulls":
+        await write_behind.flush()
+    applied, rejected = await db.write(apply_bulk, action, rows)
+    failures += rejected
+    if action == "set_pulls":
+        # Same as admin_set_pulls: those users' cached pull counts are stale now
+        invalidate_user_states({user_id for _, user_id, _ in rows})
+    log_event(admin_log, "bulk_admin", admin_id=interaction.user.id, action=action, file=file.filename,
+              rows=total, applied=applied, failed=len(failures))
+    embed = discord.Embed(title="Admin Action", description=f"`{action}`: applied {applied} rows, {len(failures)} failed.", color=0xff8800)
+    if failures:
+        shown = "\n".join(f"line {line}: {reason}" for line, reason in sorted(failures)[:BULK_FAILURES_SHOWN])
+        embed.add_field(name="Failures", value=shown[:1024], inline=False)
+    report = discord.File(io.BytesIO(failures_csv(failures).encode()), filename="failures.csv") if len(failures) > BULK_FAILURES_SHOWN else discord.utils.MISSING
+    await interaction.followup.send(embed=embed, file=report, ephemeral=True)
+
+@tree.command(name="droprates", description="[ADMIN] Compare observed drop rates with the configured weights.")
+@discord.app_commands.describe(hours="Only count pulls from the last N hours (default: every pull on the current item pool)")
+async def droprates(interaction: discord.Interaction, hours: discord.app_commands.Range[int, 1, 24 * 365] = None):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    snapshot = catalogue.current
+    if snapshot.sampler is None:
+        embed = discord.Embed(title="Drop Rates", description="The item pool is empty.", color=0xff5555)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    await write_behind.flush()
+    since_ms = int((time.time() - hours * 3600) * 1000) if hours else 0
+    rows, total, chi2, critical, df = drop_rate_report(snapshot, await db.read(get_observed_drops, snapshot.version, since_ms))
+    window = f"last {hours}h" if hours else "all time"
+    embed = discord.Embed(title="Drop Rates", description=f"{total} pulls on item pool v{snapshot.version} ({window})", color=0xff8800)
+    lines = [f"`{rarity:<9}` {pulls:>7}  {observed:6.2%} vs {expected:6.2%}" for rarity, pulls, observed, expected in rows]
+    embed.add_field(name="Rarity · pulls · observed vs expected", value="\n".join(lines), inline=False)
+    if total:
+        verdict = "consistent with the weights" if chi2 <= critical else "unlikely under the weights (p < 0.05)"
+        embed.add_field(name="Chi-square", value=f"{chi2:.2f} (95% cutoff {critical:.2f}, df {df}): {verdict}", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@tree.command(name="perf", description="[ADMIN] Show command latency and database timings.")
+async def perf(interaction: discord.Interaction):
+    if not is_admin(interaction):
+        embed = discord.Embed(title="Unauthorized", description="You are not authorized to use this command.", color=0xff0000)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    embed = discord.Embed(title="Performance", color=0xff8800)
+    # Busiest commands first; embeds hold at most 25 fields
+    rows = sorted(metrics.summary(), key=lambda row: -row["calls"])[:20]
+    for row in rows:
+        embed.add_field(
+            name=f"/{row['command']}",
+            value=(f"{row['calls']} calls, {row['errors']} errors\n"
+                   f"avg {row['avg_ms']:.1f} ms, p95 ≤{row['p95_ms']:.0f} ms\n"
+                   f"SQL {row['sql_ms']:.2f} ms, {row['statements']:.1f} stmts, {row['api_calls']:.1f} API calls"),
+            inline=True,
+        )
+    if not rows:
+        embed.description = "No commands recorded yet."
+    wb = write_behind.stats()
+    embed.set_footer(text=f"Pull queue: {wb['queue_depth']} waiting, {wb['flushes']} flushes, avg {wb['avg_flush_ms']} ms")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Every command above reports latency, SQL time and API calls to metrics
+instrument_tree(tree)
+startup.mark("commands")
+
+
+# To run the bot, put your token in a .env file as DISCORD_TOKEN=your_token_here
+
+async def run_bot(token):
+    loop = asyncio.get_running_loop()
+    # ControlPanel.stop_bot sends SIGTERM: close the gateway cleanly so queued pulls get flushed
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(bot.close()))
+        except (NotImplementedError, RuntimeError):
+            pass  # Not supported on Windows event loops
+    count_api_calls()
+    async with bot:
+        write_behind.start()
+        pollers = [
+            asyncio.create_task(poll_catalogue()), asyncio.create_task(poll_user_data()),
+            asyncio.create_task(poll_leaderboards()), asyncio.create_task(write_metrics_periodically()),
+        ]
+        metrics_server = await serve_metrics() if METRICS_PORT else None
+        try:
+            await bot.start(token)
+        finally:
+            for poller in pollers:
+                poller.cancel()
+            if metrics_server:
+                metrics_server.close()
+            await write_behind.close()
+            log_event(log, "shutdown_flush", **write_behind.stats())
+            try:
+                metrics.write_file()
+            except OSError as e:
+                log.warning("Failed to write metrics file: %s", e)
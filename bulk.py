@@ -0,0 +1,135 @@
+
+"""Bulk admin changes from CSV, shared by the /admin_bulk command and the control panel.
+
+One row per user; a header row is optional:
+
+    give_item      user_id,item[,amount]
+    set_pulls      user_id,pulls
+    daily_reward   user_id
+    weekly_reward  user_id
+
+parse_bulk() checks the rows' shape; apply_bulk() checks them against the
+database (item names are looked up once for the whole file) and applies every
+valid row with executemany or a single set-based UPDATE, so run it as one
+write transaction. Both return per-row failures as (line, reason).
+"""
+
+import csv
+import datetime
+import io
+import json
+
+from players import INSERT_USER, UPSERT_INVENTORY, bump_user_data_version, score_new_items
+
+BULK_ACTIONS = ("give_item", "set_pulls", "daily_reward", "weekly_reward")
+# (users column, coins granted); the same amounts as /daily and /weekly
+REWARDS = {"daily_reward": ("last_daily", 100), "weekly_reward": ("last_weekly", 500)}
+COLUMNS = {"give_item": (2, 3), "set_pulls": (2, 2), "daily_reward": (1, 1), "weekly_reward": (1, 1)}
+USAGE = {"give_item": "user_id,item[,amount]", "set_pulls": "user_id,pulls", "daily_reward": "user_id", "weekly_reward": "user_id"}
+
+
+def reward_period(action, now=None):
+    now = now or datetime.datetime.now()
+    if action == "daily_reward":
+        return str(now.date())
+    year, week, _ = now.isocalendar()
+    return f"{year}-W{week}"
+
+
+def parse_bulk(action, text):
+    """Return (rows, failures); each row is (line, user_id, *values) with the numbers already converted."""
+    low, high = COLUMNS[action]
+    rows, failures = [], []
+    for line, fields in enumerate(csv.reader(io.StringIO(text)), 1):
+        fields = [field.strip() for field in fields]
+        if not any(fields):
+            continue
+        if line == 1 and not fields[0].lstrip("-").isdigit():
+            continue  # Header
+        if not low <= len(fields) <= high:
+            failures.append((line, f"expected {USAGE[action]}"))
+            continue
+        try:
+            user_id = int(fields[0])
+            if action == "give_item":
+                amount = int(fields[2]) if len(fields) > 2 and fields[2] else 1
+                if amount < 1:
+                    raise ValueError
+                rows.append((line, user_id, fields[1], amount))
+            elif action == "set_pulls":
+                pulls = int(fields[1])
+                if pulls < 0:
+                    raise ValueError
+                rows.append((line, user_id, pulls))
+            else:
+                rows.append((line, user_id))
+        except ValueError:
+            # Ids and counts are whole numbers; amounts start at 1, pull counts at 0
+            failures.append((line, f"bad number for {USAGE[action]}"))
+    return rows, failures
+
+
+def give_items(conn, rows):
+    # Every item name is resolved against one read of the pool; case only matters when it has to
+    exact = dict(conn.execute("SELECT item, item_id FROM items WHERE NOT retired").fetchall())
+    folded = {}
+    for item, item_id in exact.items():
+        folded.setdefault(item.casefold(), item_id)
+    valid, failures = [], []
+    for line, user_id, item, amount in rows:
+        item_id = exact.get(item) or folded.get(item.casefold())
+        if item_id is None:
+            failures.append((line, f"item {item!r} is not in the item pool"))
+        else:
+            valid.append((user_id, item_id, amount))
+    conn.executemany(INSERT_USER, [(u, str(u)) for u, _, _ in valid])
+    score_new_items(conn, [(u, item_id) for u, item_id, _ in valid])
+    conn.executemany(UPSERT_INVENTORY, valid)
+    return len(valid), failures
+
+
+def set_pulls(conn, rows):
+    # A user listed twice ends up with the later row's count
+    bump_user_data_version(conn)
+    conn.executemany(INSERT_USER, [(u, str(u)) for _, u, _ in rows])
+    conn.executemany("UPDATE users SET pulls = ? WHERE user_id = ?", [(pulls, u) for _, u, pulls in rows])
+    return len(rows), []
+
+
+def grant_rewards(conn, rows, column, period, amount):
+    # column is always one of REWARDS' own names, never user input
+    user_ids = json.dumps(sorted({user_id for _, user_id in rows}))
+    known = dict(conn.execute(
+        f"SELECT user_id, {column} FROM users WHERE user_id IN (SELECT value FROM json_each(?))", (user_ids,)
+    ).fetchall())
+    granted = conn.execute(
+        f"UPDATE users SET coins = COALESCE(coins, 0) + ?, {column} = ? "
+        f"WHERE user_id IN (SELECT value FROM json_each(?)) AND {column} IS NOT ?",
+        (amount, period, user_ids, period),
+    ).rowcount
+    failures, seen = [], set()
+    for line, user_id in rows:
+        if user_id not in known:
+            failures.append((line, f"user {user_id} not found"))
+        elif known[user_id] == period or user_id in seen:
+            failures.append((line, f"user {user_id} already has this period's reward"))
+        seen.add(user_id)
+    return granted, failures
+
+
+def apply_bulk(conn, action, rows, period=None):
+    """Apply parsed rows in the caller's transaction; returns (rows applied, failures)."""
+    if action == "give_item":
+        return give_items(conn, rows)
+    if action == "set_pulls":
+        return set_pulls(conn, rows)
+    column, amount = REWARDS[action]
+    return grant_rewards(conn, rows, column, period or reward_period(action), amount)
+
+
+def failures_csv(failures):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(("line", "error"))
+    writer.writerows(sorted(failures))
+    return out.getvalue()
@@ -0,0 +1,223 @@
+
+import json
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+from game import RARITY_POINTS
+from players import adjust_item_score
+from sampler import AliasSampler
+
+
+# item_id and rarity_id are the integer keys inventory, pull_history and the rarity counters use
+ItemInfo = namedtuple("ItemInfo", "rarity description image item_id rarity_id")
+
+# Bumped by every edit to the items table (bot admin commands and the control panel)
+VERSION_KEY = "item_pool_version"
+
+
+def get_catalogue_version(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (VERSION_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_catalogue_version(conn):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1",
+        (VERSION_KEY,),
+    )
+    record_pool_version(conn)
+
+
+def record_pool_version(conn):
+    """Keep the pool each version was drawn from, so recorded pulls can be replayed after later edits.
+
+    Call after the items table has been edited; a version is only ever recorded once.
+    """
+    pool = conn.execute("""
+        SELECT i.item, r.name, i.item_id FROM items i JOIN rarities r ON r.rarity_id = i.rarity_id
+        WHERE NOT i.retired ORDER BY i.item
+    """).fetchall()
+    conn.execute(
+        "INSERT OR IGNORE INTO item_pool_versions (version, pool) VALUES (?, ?)",
+        (get_catalogue_version(conn), json.dumps(pool, ensure_ascii=False)),
+    )
+
+
+def pool_version_recorded(conn):
+    return conn.execute(
+        "SELECT 1 FROM item_pool_versions WHERE version = ?", (get_catalogue_version(conn),)
+    ).fetchone() is not None
+
+
+def get_rarity_id(conn, name):
+    """The id for a rarity name; names outside the game's RARITY_ORDER are added on first use at tier -1."""
+    row = conn.execute("SELECT rarity_id FROM rarities WHERE name = ?", (name,)).fetchone()
+    if row:
+        return row[0]
+    return conn.execute("INSERT INTO rarities (name, tier) VALUES (?, -1)", (name,)).lastrowid
+
+
+def load_pool_version(conn, version):
+    # [(item, rarity, item_id), ...] sorted by item, or None if that version was never recorded
+    row = conn.execute("SELECT pool FROM item_pool_versions WHERE version = ?", (version,)).fetchone()
+    return [tuple(entry) for entry in json.loads(row[0])] if row else None
+
+
+# --- Item pool edits (the bot's admin commands and the control panel) ---
+
+def find_item(conn, name):
+    """(item_id, item, rarity) of the live item with this name, ignoring case, or None."""
+    return conn.execute(
+        "SELECT i.item_id, i.item, r.name FROM items i JOIN rarities r ON r.rarity_id = i.rarity_id "
+        "WHERE i.item = ? COLLATE NOCASE AND NOT i.retired",
+        (name,),
+    ).fetchone()
+
+
+def insert_item(conn, item, rarity):
+    row = conn.execute("SELECT item_id, retired FROM items WHERE item = ?", (item,)).fetchone()
+    if row and not row[1]:
+        return False
+    if row:
+        # Re-adding a removed item brings back the same id, so copies players still own count again
+        conn.execute("UPDATE items SET rarity_id = ?, retired = 0 WHERE item = ?", (get_rarity_id(conn, rarity), item))
+        adjust_item_score(conn, row[0], RARITY_POINTS.get(rarity, 1))
+    else:
+        conn.execute("INSERT INTO items (item, rarity_id) VALUES (?, ?)", (item, get_rarity_id(conn, rarity)))
+    bump_catalogue_version(conn)
+    return True
+
+
+def live_item(conn, item):
+    return conn.execute(
+        "SELECT i.item_id, r.name FROM items i JOIN rarities r ON r.rarity_id = i.rarity_id "
+        "WHERE i.item = ? AND NOT i.retired",
+        (item,),
+    ).fetchone()
+
+
+def delete_item(conn, item):
+    # Retired rather than deleted: inventories and pull history keep pointing at the id
+    row = live_item(conn, item)
+    if row is None:
+        return 0
+    item_id, rarity = row
+    conn.execute("UPDATE items SET retired = 1 WHERE item_id = ?", (item_id,))
+    adjust_item_score(conn, item_id, -RARITY_POINTS.get(rarity, 1))
+    bump_catalogue_version(conn)
+    return 1
+
+
+def update_item_field(conn, item, column, value):
+    # column is always one of our own names, never user input
+    updated = conn.execute(f"UPDATE items SET {column} = ? WHERE item = ? AND NOT retired", (value, item)).rowcount
+    if updated:
+        bump_catalogue_version(conn)
+    return updated
+
+
+def update_item_rarity(conn, item, rarity):
+    row = live_item(conn, item)
+    if row is None:
+        return 0
+    item_id, old = row
+    update_item_field(conn, item, "rarity_id", get_rarity_id(conn, rarity))
+    adjust_item_score(conn, item_id, RARITY_POINTS.get(rarity, 1) - RARITY_POINTS.get(old, 1))
+    return 1
+
+
+def fold_name(name):
+    # Case- and accent-insensitive form used for matching typed names: "Ó" and "o" fold the same
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def build_name_index(names):
+    """Sorted (key, name, whole) entries for prefix lookups.
+
+    Every word of a name is a key, so "fork" finds "Golden Fork"; whole is True for the key that is the full name.
+    """
+    index = set()
+    for name in names:
+        folded = fold_name(name)
+        index.add((folded, name, True))
+        for start in range(1, len(folded)):
+            if folded[start - 1] == " " and folded[start] != " ":
+                index.add((folded[start:], name, False))
+    return sorted(index)
+
+
+def build_sampler(pool, weights):
+    # Shared with replay: the same sorted pool must always build the same alias table
+    return AliasSampler(pool, [weights.get(rarity, 1) for _, rarity in pool]) if pool else None
+
+
+class CatalogueSnapshot:
+    """Immutable view of the items table at one version, with a sampler over it."""
+
+    def __init__(self, version, items, weights):
+        self.version = version
+        self.items = items
+        # Anything derived from this version (e.g. prebuilt embeds) lives and dies with the snapshot
+        self.cache = {}
+        # Sorted so the same pool always builds the same alias table
+        self.sampler = build_sampler(sorted((name, info.rarity) for name, info in items.items()), weights)
+        self.name_index = build_name_index(items)
+
+    def get(self, item):
+        return self.items.get(item)
+
+    def complete(self, prefix, limit=25):
+        """Item names with a word starting with prefix (case and accents ignored); whole-name matches first."""
+        prefix = fold_name(prefix).lstrip()
+        whole, partial = [], []
+        for position in range(bisect_left(self.name_index, (prefix,)), len(self.name_index)):
+            key, name, is_whole = self.name_index[position]
+            if not key.startswith(prefix) or len(whole) >= limit:
+                break
+            if is_whole:
+                whole.append(name)
+            elif len(partial) < limit:
+                partial.append(name)
+        # A name can match both as a whole and by a later word
+        return list(dict.fromkeys(whole + partial))[:limit]
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+
+class ItemCatalogue:
+    """In-process cache of the items table keyed by item name.
+
+    Handlers read `current` without touching the database. refresh() is cheap
+    when nothing changed (one primary-key lookup of the version stamp) and
+    reload() is used right after our own edits.
+    """
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.current = None
+
+    def reload(self, conn):
+        version = get_catalogue_version(conn)
+        rows = conn.execute("""
+            SELECT i.item, r.name, i.description, i.image, i.item_id, i.rarity_id
+            FROM items i JOIN rarities r ON r.rarity_id = i.rarity_id
+            WHERE NOT i.retired
+        """).fetchall()
+        items = {
+            item: ItemInfo(rarity, description or None, image or None, item_id, rarity_id)
+            for item, rarity, description, image, item_id, rarity_id in rows
+        }
+        # Swap the whole snapshot so readers never see a half-built catalogue
+        self.current = CatalogueSnapshot(version, items, self.weights)
+        return self.current
+
+    def refresh(self, conn):
+        if self.current is None or get_catalogue_version(conn) != self.current.version:
+            return self.reload(conn)
+        return self.current
@@ -0,0 +1,274 @@
+"""Text mode (python main.py --cli): play as a local user, or run a batch of admin commands, without discord.py.
+
+Batch mode reads one command per line from a file, or from stdin with "-":
+
+    python main.py --cli --batch seed.txt
+    printf 'pull 1001 500000\\nexport users.jsonl\\n' | python main.py --cli --batch -
+
+    pull USER [COUNT]          draw COUNT items (default 1) for any user id, with achievements
+    give USER ITEM [AMOUNT]    quote item names with spaces: give 42 "cheese cup" 3
+    setpulls USER PULLS
+    export PATH [USER ...]     users, inventories and achievements as JSON lines ("-" for stdout)
+
+Blank lines and lines starting with # are skipped. Commands are applied in
+order, many to a write transaction; a line that fails is reported with its
+line number and skipped.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shlex
+import sys
+import time
+from collections import Counter
+
+from core import (
+    db, catalogue, rng_stream, apply_pulls, summarize_pulls, get_inventory, get_user_achievements,
+    award_achievements, flush_pull_events, id_counts, load_user_state, pull_history_rows,
+)
+from game import ACHIEVEMENTS
+from players import give_item, set_pulls
+from rng import draw_items
+
+# Pulls (other commands count as one) per write transaction; big pulls are split to fit
+BATCH_TRANSACTION_SIZE = int(os.getenv("RNG_BATCH_TRANSACTION_SIZE", "100000"))
+
+
+def interactive():
+    print("Tactas RNG CLI Mode\nType 'pull [count]' to pull items, 'inv' for inventory, 'ach' for achievements, 'exit' to quit.")
+    user_id = 1  # Local user
+    username = "localuser"
+    db.write_sync(lambda conn: conn.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (user_id, username)))
+    while True:
+        cmd = input("> ").strip().lower()
+        if cmd == "pull" or cmd.startswith("pull "):
+            args = cmd.split()
+            count = 1
+            if len(args) > 1:
+                if not args[1].isdigit() or not 1 <= int(args[1]) <= rng_stream.block_size:
+                    print(f"Usage: pull [count], count at most {rng_stream.block_size}")
+                    continue
+                count = int(args[1])
+            snapshot = db.read_sync(catalogue.refresh)
+            sampler = snapshot.sampler
+            if sampler is None:
+                print("The item pool is empty.")
+                continue
+            stream_id, rng_pos, draws = draw_items(sampler, rng_stream, count)
+            counts = db.write_sync(apply_pulls, user_id, username, draws, snapshot, stream_id, rng_pos)
+            if count == 1:
+                item, rarity = draws[0]
+                print(f"You pulled: {item} ({rarity})")
+            else:
+                print(f"You pulled {count} items:")
+                for (item, rarity), amount in summarize_pulls(counts):
+                    print(f"  {item} ({rarity}) x{amount}")
+        elif cmd == "inv":
+            items = db.read_sync(get_inventory, user_id)
+            if not items:
+                print("Inventory is empty.")
+            else:
+                for item, rarity, amount in items:
+                    print(f"{item} ({rarity}) x{amount}")
+        elif cmd == "ach":
+            user_achievements = db.read_sync(get_user_achievements, user_id)
+            if not user_achievements:
+                print("No achievements yet.")
+            else:
+                for aid, name, desc, _ in ACHIEVEMENTS:
+                    if aid in user_achievements:
+                        print(f"🏅 {name}: {desc}")
+        elif cmd == "exit":
+            print("Goodbye!")
+            break
+        else:
+            print("Commands: pull [count], inv, ach, exit")
+
+
+# --- Batch mode ---
+
+class BatchError(Exception):
+    pass
+
+
+def parse_int(value, what, minimum=None):
+    try:
+        number = int(value)
+    except ValueError:
+        raise BatchError(f"{what} must be a whole number, got {value!r}") from None
+    if minimum is not None and number < minimum:
+        raise BatchError(f"{what} must be at least {minimum}")
+    return number
+
+
+def run_ops(conn, ops):
+    """Apply one transaction's worth of batch operations in order."""
+    events = []
+    for op in ops:
+        if op[0] == "pulls":
+            events.append(op[1])
+            continue
+        # Anything else sees the pulls before it
+        if events:
+            flush_pull_events(conn, events)
+            events = []
+        if op[0] == "give":
+            give_item(conn, *op[1:])
+        elif op[0] == "setpulls":
+            set_pulls(conn, *op[1:])
+    if events:
+        flush_pull_events(conn, events)
+
+
+def export_users(conn, out, user_ids=None):
+    if user_ids:
+        users = [row for user_id in user_ids for row in conn.execute(
+            "SELECT user_id, username, pulls, coins FROM users WHERE user_id = ?", (user_id,))]
+    else:
+        users = conn.execute("SELECT user_id, username, pulls, coins FROM users ORDER BY user_id")
+    count = 0
+    for user_id, username, pulls, coins in users:
+        inventory = conn.execute(
+            "SELECT i.item, inv.amount FROM inventory inv JOIN items i ON i.item_id = inv.item_id WHERE inv.user_id = ?",
+            (user_id,),
+        ).fetchall()
+        out.write(json.dumps({
+            "user_id": user_id, "username": username, "pulls": pulls, "coins": coins,
+            "inventory": dict(inventory), "achievements": sorted(get_user_achievements(conn, user_id)),
+        }, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+class BatchRunner:
+    def __init__(self, transaction_size=BATCH_TRANSACTION_SIZE):
+        self.transaction_size = max(1, transaction_size)
+        self.snapshot = db.read_sync(catalogue.refresh)
+        self.states = {}  # user_id -> UserState, ahead of the pending transaction
+        self.ops = []
+        self.pending = 0
+        self.commands = 0
+        self.pulls = 0
+        self.transactions = 0
+        self.failures = 0
+
+    def commit(self):
+        if self.ops:
+            db.write_sync(run_ops, self.ops)
+            self.transactions += 1
+            self.ops = []
+            self.pending = 0
+
+    def add(self, op, weight=1):
+        if self.pending + weight > self.transaction_size:
+            self.commit()
+        self.ops.append(op)
+        self.pending += weight
+
+    def state(self, user_id):
+        state = self.states.get(user_id)
+        if state is None:
+            # pull and setpulls cache the user before queueing anything that changes these counters,
+            # so an uncached user has no pending change to them and the committed rows are current
+            state = self.states[user_id] = db.read_sync(load_user_state, user_id)
+        return state
+
+    def pull(self, user_id, count):
+        sampler = self.snapshot.sampler
+        if sampler is None:
+            raise BatchError("the item pool is empty")
+        state = self.state(user_id)
+        date = datetime.datetime.now().isoformat()
+        while count:
+            # One draw takes its uniforms from a single stream block
+            size = min(count, self.transaction_size, rng_stream.block_size)
+            stream_id, rng_pos, draws = draw_items(sampler, rng_stream, size)
+            counts = Counter(draws)
+            rarity_counts = Counter()
+            for (_, rarity), amount in counts.items():
+                rarity_counts[rarity] += amount
+            awarded = award_achievements(state, state.add_pulls(rarity_counts))
+            event = (user_id, str(user_id), id_counts(counts, self.snapshot), [aid for aid, _, _ in awarded], date,
+                     pull_history_rows(user_id, draws, self.snapshot, stream_id, rng_pos))
+            self.add(("pulls", event), size)
+            self.pulls += size
+            count -= size
+
+    def execute(self, words):
+        command, args = words[0].lower(), words[1:]
+        if command == "pull" and 1 <= len(args) <= 2:
+            self.pull(parse_int(args[0], "USER"), parse_int(args[1], "COUNT", 1) if len(args) > 1 else 1)
+        elif command == "give" and 2 <= len(args) <= 3:
+            info = self.snapshot.get(args[1])
+            if info is None:
+                raise BatchError(f"item {args[1]!r} is not in the item pool")
+            amount = parse_int(args[2], "AMOUNT", 1) if len(args) > 2 else 1
+            self.add(("give", parse_int(args[0], "USER"), info.item_id, amount))
+        elif command == "setpulls" and len(args) == 2:
+            user_id, pulls = parse_int(args[0], "USER"), parse_int(args[1], "PULLS", 0)
+            # Later pulls for this user check achievements against the new count
+            self.state(user_id).stats["pulls"] = pulls
+            self.add(("setpulls", user_id, pulls))
+        elif command == "export" and args:
+            user_ids = [parse_int(arg, "USER") for arg in args[1:]]
+            self.commit()
+            if args[0] == "-":
+                count = db.read_sync(export_users, sys.stdout, user_ids)
+            else:
+                with open(args[0], "w", encoding="utf-8") as f:
+                    count = db.read_sync(export_users, f, user_ids)
+            print(f"Exported {count} users to {args[0]}", file=sys.stderr)
+        else:
+            raise BatchError("usage: pull USER [COUNT] | give USER ITEM [AMOUNT] | setpulls USER PULLS | export PATH [USER ...]")
+        self.commands += 1
+
+    def run(self, lines):
+        for number, line in enumerate(lines, 1):
+            try:
+                words = shlex.split(line, comments=True)
+            except ValueError as e:
+                words, error = None, e
+            else:
+                error = None
+            if words == []:
+                continue
+            try:
+                if error:
+                    raise BatchError(error)
+                self.execute(words)
+            except (BatchError, OSError) as e:
+                self.failures += 1
+                print(f"line {number}: {e}", file=sys.stderr)
+        self.commit()
+
+
+def run_batch(path, transaction_size=BATCH_TRANSACTION_SIZE):
+    runner = BatchRunner(transaction_size)
+    start = time.perf_counter()
+    if path == "-":
+        runner.run(sys.stdin)
+    else:
+        with open(path, encoding="utf-8") as f:
+            runner.run(f)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{runner.commands} commands ({runner.failures} failed), {runner.pulls} pulls, {runner.transactions} transactions "
+        f"in {elapsed:.2f}s: {runner.commands / elapsed if elapsed else 0:.0f} commands/s, "
+        f"{runner.pulls / elapsed if elapsed else 0:.0f} pulls/s",
+        file=sys.stderr,
+    )
+    return runner.failures
+
+
+def main(argv=()):
+    parser = argparse.ArgumentParser(prog="main.py --cli", description="Play from the terminal, or run a batch of commands.")
+    parser.add_argument("--batch", metavar="FILE", help="run the commands in FILE ('-' for stdin) instead of prompting")
+    parser.add_argument("--transaction-size", type=int, default=BATCH_TRANSACTION_SIZE,
+                        help=f"pulls per write transaction in batch mode (default {BATCH_TRANSACTION_SIZE})")
+    args = parser.parse_args(argv)
+    if args.batch:
+        return 1 if run_batch(args.batch, args.transaction_size) else 0
+    interactive()
+    return 0
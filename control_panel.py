@@ -1,16 +1,263 @@
 
 import tkinter as tk
-from tkinter import messagebox, simpledialog, scrolledtext
-import sqlite3
+from tkinter import filedialog, messagebox, simpledialog, scrolledtext, ttk
+import datetime
+import json
+import queue
 import subprocess
 import threading
 import os
 import signal
+from catalogue import delete_item, find_item, insert_item, update_item_field, update_item_rarity
+from db import DB_PATH, connect, init_schema, retry_on_busy, schema_is_current
+from migrations import migrate
+from players import give_item, reset_user_data, set_pulls
+from images import is_remote, prepare_image, record_image
+from bulk import BULK_ACTIONS, USAGE, apply_bulk, parse_bulk
+from metrics import METRICS_FILE, read_summary
 
 
-DB_PATH = "rng_game.db"
 BOT_PATH = "main.py"
-LOG_PATH = "bot.log"
+LOG_PATH = os.getenv("RNG_LOG_FILE", "bot.log")
+# Bot stdout/stderr: startup errors and anything printed before logging is set up.
+# bot.log itself is written (and rotated) by the bot; both are shown in the log widget.
+BOT_OUTPUT_PATH = "bot.out"
+LOG_MAX_LINES = 1000  # Lines kept in the log widget
+LOG_INITIAL_BYTES = 64 * 1024  # How much of an existing log to show when we start tailing it
+LOG_READ_BYTES = 1024 * 1024  # Cap per refresh; anything beyond is picked up next time
+LOG_HEAD_BYTES = 64  # Start of the file remembered to spot truncate-and-rewrite
+PAGE_SIZE = 100  # Rows fetched per page in table views
+
+
+def format_log_line(line):
+    # bot.log holds JSON lines; show them as "time level event key=value ..."
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return line
+    if not isinstance(entry, dict):
+        return line
+    ts = entry.pop("ts", "")[11:19]
+    level = entry.pop("level", "")
+    event = entry.pop("event", "")
+    entry.pop("logger", None)
+    exc = entry.pop("exc", None)
+    text = " ".join([ts, level, event] + [f"{key}={value}" for key, value in entry.items()])
+    return text + ("\n" + exc if exc else "")
+
+
+class QueryWorker:
+    """Runs panel queries on a background thread with its own connection.
+
+    Results are handed back to Tk through a queue that the panel drains
+    with after(), so callbacks always run on the Tk main thread. If the
+    database can't be opened or upgraded, on_startup_error gets the error
+    and every job after that fails with it.
+    """
+
+    def __init__(self, path=DB_PATH, on_startup_error=None):
+        self.path = path
+        self.on_startup_error = on_startup_error
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="panel-db", daemon=True)
+        self.thread.start()
+
+    def _open(self):
+        conn = connect(self.path)
+        try:
+            if not schema_is_current(conn):
+                init_schema(conn)
+                conn.commit()
+                migrate(lambda fn, *args: retry_on_busy(self._call, conn, fn, args))
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _run(self):
+        conn = error = None
+        try:
+            conn = self._open()
+        except Exception as e:
+            error = e
+            self.results.put((self.on_startup_error, e))
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            fn, args, on_done, on_error = job
+            if error is not None:
+                # Keep answering, so callers waiting on a job aren't left hanging
+                self.results.put((on_error, error))
+                continue
+            try:
+                result = retry_on_busy(self._call, conn, fn, args)
+            except Exception as e:
+                self.results.put((on_error, e))
+            else:
+                self.results.put((on_done, result))
+        if conn is not None:
+            conn.close()
+
+    def _call(self, conn, fn, args):
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+    def submit(self, fn, *args, on_done=None, on_error=None):
+        self.jobs.put((fn, args, on_done, on_error))
+
+    def close(self):
+        self.jobs.put(None)
+
+
+# --- Panel queries (run on the QueryWorker thread) ---
+
+def fetch_users_page(conn, after, limit):
+    return conn.execute(
+        "SELECT user_id, username, pulls FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+        (after if after is not None else -2 ** 63, limit),
+    ).fetchall()
+
+def fetch_inventory_page(conn, user_id, after, limit):
+    return conn.execute(
+        "SELECT i.item, r.name, inv.amount FROM inventory inv "
+        "JOIN items i ON i.item_id = inv.item_id JOIN rarities r ON r.rarity_id = i.rarity_id "
+        "WHERE inv.user_id = ? AND i.item > ? ORDER BY i.item LIMIT ?",
+        (user_id, after if after is not None else "", limit),
+    ).fetchall()
+
+def fetch_items_page(conn, after, limit):
+    return conn.execute(
+        "SELECT i.item, r.name, i.description, i.image FROM items i JOIN rarities r ON r.rarity_id = i.rarity_id "
+        "WHERE i.item > ? AND NOT i.retired ORDER BY i.item LIMIT ?",
+        (after if after is not None else "", limit),
+    ).fetchall()
+
+def fetch_leaderboard(conn):
+    return conn.execute("SELECT username, pulls FROM users ORDER BY pulls DESC LIMIT 10").fetchall()
+
+def fetch_description(conn, item):
+    row = conn.execute("SELECT description FROM items WHERE item = ?", (item,)).fetchone()
+    return row[0] if row else None
+
+def prepare_item_image(image):
+    """Hash and thumbnail a local image ahead of set_item_image; returns (prepared, warning)."""
+    # Done now so the bot's first pull of the item doesn't pay for it, and outside the write transaction
+    if is_remote(image):
+        return None, None
+    if not os.path.isfile(image):
+        return None, "file not found; the bot will show no image until it exists"
+    try:
+        return prepare_image(image), None
+    except OSError as e:
+        return None, f"could not read the image ({e}); the bot will try again when it is shown"
+
+def set_item_image(conn, item, image, prepared=None):
+    updated = update_item_field(conn, item, "image", image)
+    if updated and prepared:
+        record_image(conn, image, *prepared)
+    return updated
+
+def grant_reward(conn, user_id, column, period, amount):
+    # Returns the new coin total, "claimed" if already claimed this period, or None for unknown users
+    row = conn.execute(f"SELECT {column}, coins FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if not row:
+        return None
+    last_claim, coins = row
+    if last_claim == period:
+        return "claimed"
+    new_coins = (coins or 0) + amount
+    conn.execute(f"UPDATE users SET coins = ?, {column} = ? WHERE user_id = ?", (new_coins, period, user_id))
+    return new_coins
+
+def fetch_streaks(conn, user_id):
+    return conn.execute("SELECT last_daily, last_weekly FROM users WHERE user_id = ?", (user_id,)).fetchone()
+
+def give_named_item(conn, user_id, item, amount):
+    found = find_item(conn, item)
+    if not found:
+        return None
+    item_id, item, rarity = found
+    give_item(conn, user_id, item_id, amount)
+    return item, rarity
+
+
+class PagedTable(tk.Toplevel):
+    """Table window that loads one page at a time with keyset pagination.
+
+    fetch_page(conn, after, limit) must return rows ordered by the key that
+    key_of(row) extracts; only the current page is ever held in memory.
+    """
+
+    def __init__(self, panel, title, columns, fetch_page, key_of, page_size=PAGE_SIZE):
+        super().__init__(panel)
+        self.title(title)
+        self.geometry("600x450")
+        self.panel = panel
+        self.fetch_page = fetch_page
+        self.key_of = key_of
+        self.page_size = page_size
+        self.cursors = [None]  # Key each visited page starts after
+        self.has_next = False
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        for column in columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=120, stretch=True)
+        scroll = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        nav = tk.Frame(self)
+        self.prev_button = tk.Button(nav, text="◀ Prev", command=self.prev_page)
+        self.next_button = tk.Button(nav, text="Next ▶", command=self.next_page)
+        self.status = tk.Label(nav, text="Loading...")
+        self.prev_button.pack(side="left", padx=5)
+        self.status.pack(side="left", expand=True)
+        self.next_button.pack(side="right", padx=5)
+        nav.pack(side="bottom", fill="x", pady=5)
+        scroll.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.load()
+
+    def load(self):
+        self.prev_button.config(state="disabled")
+        self.next_button.config(state="disabled")
+        self.status.config(text="Loading...")
+        # One extra row tells us whether there is a next page
+        self.panel.run_query(self.fetch_page, self.cursors[-1], self.page_size + 1, on_done=self.show_page, on_error=self.show_error)
+
+    def show_error(self, error):
+        if self.winfo_exists():
+            self.status.config(text="Could not load this page.")
+        self.panel.show_query_error(error)
+
+    def show_page(self, rows):
+        if not self.winfo_exists():
+            return
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            self.tree.insert("", tk.END, values=[("" if value is None else value) for value in row])
+        self.last_key = self.key_of(rows[-1]) if rows else None
+        page = len(self.cursors)
+        self.status.config(text=f"Page {page} · {len(rows)} rows" if rows else "No rows.")
+        self.prev_button.config(state="normal" if page > 1 else "disabled")
+        self.next_button.config(state="normal" if self.has_next else "disabled")
+
+    def next_page(self):
+        if self.has_next:
+            self.cursors.append(self.last_key)
+            self.load()
+
+    def prev_page(self):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+            self.load()
 
 
 class ControlPanel(tk.Tk):
@@ -18,11 +265,14 @@ class ControlPanel(tk.Tk):
         super().__init__()
         self.title("Tactas RNG Control Panel")
         self.geometry("500x600")
-        self.conn = sqlite3.connect(DB_PATH)
-        self.c = self.conn.cursor()
+        self.worker = QueryWorker(DB_PATH, on_startup_error=self.show_startup_error)
         self.bot_process = None
         self.create_widgets()
         self.log_updater = None
+        self.output_offset = 0  # Read position in bot.out, which every start rewrites from scratch
+        self.output_partial = b""
+        self.reset_log_tail()
+        self.result_poller = self.after(50, self.poll_results)
 
     def create_widgets(self):
         tk.Label(self, text="Tactas RNG Control Panel", font=("Arial", 16)).pack(pady=10)
@@ -32,6 +282,7 @@ class ControlPanel(tk.Tk):
         tk.Button(self, text="View User Inventory", command=self.view_inventory).pack(pady=5)
         tk.Button(self, text="Reset All Data", command=self.reset_data, fg="red").pack(pady=5)
         tk.Button(self, text="View Leaderboard", command=self.view_leaderboard).pack(pady=5)
+        tk.Button(self, text="View Performance Metrics", command=self.view_metrics).pack(pady=5)
         # Daily/Weekly rewards
         tk.Label(self, text="Rewards", font=("Arial", 12, "bold")).pack(pady=8)
         tk.Button(self, text="Grant Daily Reward (Manual)", command=self.grant_daily_reward).pack(pady=2)
@@ -46,6 +297,42 @@ class ControlPanel(tk.Tk):
         tk.Button(self, text="Edit Item Description", command=self.edit_item_description_pool).pack(pady=2)
         tk.Button(self, text="View Item Description", command=self.view_item_description_pool).pack(pady=2)
         tk.Button(self, text="Set Item Image Path", command=self.set_item_image_pool).pack(pady=2)
+        # Admin controls
+        tk.Label(self, text="Admin Controls", font=("Arial", 12, "bold")).pack(pady=8)
+        tk.Button(self, text="Give Item to User (Admin)", command=self.admin_give_item).pack(pady=2)
+        tk.Button(self, text="Set User Pulls (Admin)", command=self.admin_set_pulls).pack(pady=2)
+        tk.Button(self, text="Bulk Update from CSV (Admin)", command=self.admin_bulk).pack(pady=2)
+        tk.Button(self, text="View Pending Trades (Admin)", command=self.admin_view_trades).pack(pady=2)
+        tk.Button(self, text="Cancel Trade (Admin)", command=self.admin_cancel_trade).pack(pady=2)
+        tk.Label(self, text="Bot Logs:").pack(pady=5)
+        self.log_output = scrolledtext.ScrolledText(self, height=12, width=60, state='disabled')
+        self.log_output.pack(pady=5)
+        tk.Button(self, text="Refresh Logs", command=self.update_logs).pack(pady=2)
+        self.output = tk.Text(self, height=10, width=60)
+        self.output.pack(pady=10)
+    def run_query(self, fn, *args, on_done=None, on_error=None):
+        """Run fn(conn, *args) on the worker thread; on_done(result) is called back on the Tk thread."""
+        self.worker.submit(fn, *args, on_done=on_done, on_error=on_error or self.show_query_error)
+
+    def poll_results(self):
+        try:
+            while True:
+                callback, value = self.worker.results.get_nowait()
+                if callback:
+                    callback(value)
+        except queue.Empty:
+            pass
+        self.result_poller = self.after(50, self.poll_results)
+
+    def show_query_error(self, error):
+        messagebox.showerror("Database Error", str(error))
+
+    def show_startup_error(self, error):
+        messagebox.showerror("Database Error", f"Could not open {DB_PATH}: {error}\nDatabase actions will fail until the panel is restarted.")
+
+    def log_output_line(self, text):
+        self.output.insert(tk.END, text + "\n")
+
     def edit_item_description_pool(self):
         item = simpledialog.askstring("Edit Item Description", "Enter the item name:")
         if not item:
@@ -53,20 +340,19 @@ class ControlPanel(tk.Tk):
         desc = simpledialog.askstring("Edit Item Description", "Enter the new description:")
         if desc is None:
             return
-        self.c.execute("UPDATE items SET description = ? WHERE item = ?", (desc, item))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Updated description for {item}.\n")
+        self.run_query(update_item_field, item, "description", desc,
+                       on_done=lambda n: self.log_output_line(f"Updated description for {item}." if n else f"Item {item} not found."))
 
     def view_item_description_pool(self):
         item = simpledialog.askstring("View Item Description", "Enter the item name:")
         if not item:
             return
-        self.c.execute("SELECT description FROM items WHERE item = ?", (item,))
-        row = self.c.fetchone()
-        if not row or not row[0]:
-            self.output.insert(tk.END, f"No description found for {item}.\n")
-        else:
-            self.output.insert(tk.END, f"Description for {item}: {row[0]}\n")
+        def show(description):
+            if not description:
+                self.log_output_line(f"No description found for {item}.")
+            else:
+                self.log_output_line(f"Description for {item}: {description}")
+        self.run_query(fetch_description, item, on_done=show)
 
     def set_item_image_pool(self):
         item = simpledialog.askstring("Set Item Image", "Enter the item name:")
@@ -75,19 +361,19 @@ class ControlPanel(tk.Tk):
         image_path = simpledialog.askstring("Set Item Image", "Enter the image path or URL:")
         if not image_path:
             return
-        self.c.execute("UPDATE items SET image = ? WHERE item = ?", (image_path, item))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Set image for {item}.\n")
+        def prepare():
+            # Off both the Tk thread and the database worker; the worker only records the result
+            prepared, warning = prepare_item_image(image_path)
+            def done(updated):
+                if not updated:
+                    self.log_output_line(f"Item {item} not found.")
+                    return
+                self.log_output_line(f"Set image for {item}." + (f" Warning: {warning}" if warning else ""))
+            self.run_query(set_item_image, item, image_path, prepared, on_done=done)
+        threading.Thread(target=prepare, name="panel-image", daemon=True).start()
+
     def view_item_pool(self):
-        self.output.delete(1.0, tk.END)
-        self.c.execute("SELECT item, rarity FROM items ORDER BY item")
-        items = self.c.fetchall()
-        if not items:
-            self.output.insert(tk.END, "No items in the pool.\n")
-            return
-        self.output.insert(tk.END, "Item Pool:\n")
-        for item, rarity in items:
-            self.output.insert(tk.END, f"{item} ({rarity})\n")
+        PagedTable(self, "Item Pool", ("Item", "Rarity", "Description", "Image"), fetch_items_page, key_of=lambda row: row[0])
 
     def add_item_pool(self):
         item = simpledialog.askstring("Add Item", "Enter the item name:")
@@ -96,21 +382,19 @@ class ControlPanel(tk.Tk):
         rarity = simpledialog.askstring("Add Item", "Enter the rarity:")
         if not rarity:
             return
-        self.c.execute("SELECT 1 FROM items WHERE item = ?", (item,))
-        if self.c.fetchone():
-            messagebox.showerror("Error", "Item already exists.")
-            return
-        self.c.execute("INSERT INTO items (item, rarity) VALUES (?, ?)", (item, rarity))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Added {item} ({rarity}) to the item pool.\n")
+        def done(added):
+            if not added:
+                messagebox.showerror("Error", "Item already exists.")
+                return
+            self.log_output_line(f"Added {item} ({rarity}) to the item pool.")
+        self.run_query(insert_item, item, rarity, on_done=done)
 
     def remove_item_pool(self):
         item = simpledialog.askstring("Remove Item", "Enter the item name to remove:")
         if not item:
             return
-        self.c.execute("DELETE FROM items WHERE item = ?", (item,))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Removed {item} from the item pool.\n")
+        self.run_query(delete_item, item,
+                       on_done=lambda n: self.log_output_line(f"Removed {item} from the item pool." if n else f"Item {item} not found."))
 
     def edit_item_rarity_pool(self):
         item = simpledialog.askstring("Edit Item Rarity", "Enter the item name:")
@@ -119,81 +403,47 @@ class ControlPanel(tk.Tk):
         rarity = simpledialog.askstring("Edit Item Rarity", "Enter the new rarity:")
         if not rarity:
             return
-        self.c.execute("UPDATE items SET rarity = ? WHERE item = ?", (rarity, item))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Updated {item} to rarity {rarity}.\n")
-    def grant_daily_reward(self):
-        import datetime
+        self.run_query(update_item_rarity, item, rarity,
+                       on_done=lambda n: self.log_output_line(f"Updated {item} to rarity {rarity}." if n else f"Item {item} not found."))
+
+    def grant_reward(self, column, period, amount, label):
         user_id = simpledialog.askinteger("User ID", "Enter the user ID:")
         if user_id is None:
             return
-        now = datetime.datetime.now().date()
-        self.c.execute("SELECT last_daily, coins FROM users WHERE user_id = ?", (user_id,))
-        row = self.c.fetchone()
-        if not row:
-            messagebox.showerror("Error", "User not found.")
-            return
-        last_daily, coins = row
-        if last_daily == str(now):
-            messagebox.showinfo("Info", "User has already claimed today's daily reward.")
-            return
+        def done(result):
+            if result is None:
+                messagebox.showerror("Error", "User not found.")
+            elif result == "claimed":
+                messagebox.showinfo("Info", f"User has already claimed {label}.")
+            else:
+                self.log_output_line(f"Granted {column[5:]} reward to user {user_id}. Coins: {result}")
+        self.run_query(grant_reward, user_id, column, period, amount, on_done=done)
+
+    def grant_daily_reward(self):
         # Grant reward (e.g., 100 coins)
-        new_coins = (coins or 0) + 100
-        self.c.execute("UPDATE users SET coins = ?, last_daily = ? WHERE user_id = ?", (new_coins, str(now), user_id))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Granted daily reward to user {user_id}. Coins: {new_coins}\n")
+        self.grant_reward("last_daily", str(datetime.datetime.now().date()), 100, "today's daily reward")
 
     def grant_weekly_reward(self):
-        import datetime
-        user_id = simpledialog.askinteger("User ID", "Enter the user ID:")
-        if user_id is None:
-            return
-        now = datetime.datetime.now().isocalendar()
-        week_str = f"{now[0]}-W{now[1]}"
-        self.c.execute("SELECT last_weekly, coins FROM users WHERE user_id = ?", (user_id,))
-        row = self.c.fetchone()
-        if not row:
-            messagebox.showerror("Error", "User not found.")
-            return
-        last_weekly, coins = row
-        if last_weekly == week_str:
-            messagebox.showinfo("Info", "User has already claimed this week's reward.")
-            return
         # Grant reward (e.g., 500 coins)
-        new_coins = (coins or 0) + 500
-        self.c.execute("UPDATE users SET coins = ?, last_weekly = ? WHERE user_id = ?", (new_coins, week_str, user_id))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Granted weekly reward to user {user_id}. Coins: {new_coins}\n")
+        now = datetime.datetime.now().isocalendar()
+        self.grant_reward("last_weekly", f"{now[0]}-W{now[1]}", 500, "this week's reward")
 
     def check_streaks(self):
-        import datetime
         user_id = simpledialog.askinteger("User ID", "Enter the user ID:")
         if user_id is None:
             return
-        self.c.execute("SELECT last_daily, last_weekly FROM users WHERE user_id = ?", (user_id,))
-        row = self.c.fetchone()
-        if not row:
-            messagebox.showerror("Error", "User not found.")
-            return
-        last_daily, last_weekly = row
-        today = datetime.datetime.now().date()
-        week = datetime.datetime.now().isocalendar()
-        week_str = f"{week[0]}-W{week[1]}"
-        daily_status = "Claimed" if last_daily == str(today) else "Not claimed"
-        weekly_status = "Claimed" if last_weekly == week_str else "Not claimed"
-        self.output.insert(tk.END, f"User {user_id} - Daily: {daily_status}, Weekly: {weekly_status}\n")
-        # Admin controls
-        tk.Label(self, text="Admin Controls", font=("Arial", 12, "bold")).pack(pady=8)
-        tk.Button(self, text="Give Item to User (Admin)", command=self.admin_give_item).pack(pady=2)
-        tk.Button(self, text="Set User Pulls (Admin)", command=self.admin_set_pulls).pack(pady=2)
-        tk.Button(self, text="View Pending Trades (Admin)", command=self.admin_view_trades).pack(pady=2)
-        tk.Button(self, text="Cancel Trade (Admin)", command=self.admin_cancel_trade).pack(pady=2)
-        tk.Label(self, text="Bot Logs:").pack(pady=5)
-        self.log_output = scrolledtext.ScrolledText(self, height=12, width=60, state='disabled')
-        self.log_output.pack(pady=5)
-        tk.Button(self, text="Refresh Logs", command=self.update_logs).pack(pady=2)
-        self.output = tk.Text(self, height=10, width=60)
-        self.output.pack(pady=10)
+        def show(row):
+            if not row:
+                messagebox.showerror("Error", "User not found.")
+                return
+            last_daily, last_weekly = row
+            today = datetime.datetime.now().date()
+            week = datetime.datetime.now().isocalendar()
+            week_str = f"{week[0]}-W{week[1]}"
+            daily_status = "Claimed" if last_daily == str(today) else "Not claimed"
+            weekly_status = "Claimed" if last_weekly == week_str else "Not claimed"
+            self.log_output_line(f"User {user_id} - Daily: {daily_status}, Weekly: {weekly_status}")
+        self.run_query(fetch_streaks, user_id, on_done=show)
 
     def admin_view_trades(self):
         self.output.delete(1.0, tk.END)
@@ -209,15 +459,34 @@ class ControlPanel(tk.Tk):
         self.output.insert(tk.END, "(To enable this, store trades in the database in the bot.)\n")
 
     def view_leaderboard(self):
+        def show(rows):
+            self.output.delete(1.0, tk.END)
+            if not rows:
+                self.output.insert(tk.END, "No users found.\n")
+                return
+            self.output.insert(tk.END, "Leaderboard (Top 10 by Pulls):\n")
+            for idx, (username, pulls) in enumerate(rows, 1):
+                self.output.insert(tk.END, f"#{idx} {username} - Pulls: {pulls}\n")
+        self.run_query(fetch_leaderboard, on_done=show)
+
+    def view_metrics(self):
+        # The bot rewrites this file every RNG_METRICS_INTERVAL seconds
         self.output.delete(1.0, tk.END)
-        self.c.execute("SELECT username, pulls FROM users ORDER BY pulls DESC LIMIT 10")
-        rows = self.c.fetchall()
+        try:
+            rows = read_summary(METRICS_FILE)
+        except FileNotFoundError:
+            self.output.insert(tk.END, f"No metrics yet ({METRICS_FILE} is written while the bot runs).\n")
+            return
         if not rows:
-            self.output.insert(tk.END, "No users found.\n")
+            self.output.insert(tk.END, "No commands recorded yet.\n")
             return
-        self.output.insert(tk.END, "Leaderboard (Top 10 by Pulls):\n")
-        for idx, (username, pulls) in enumerate(rows, 1):
-            self.output.insert(tk.END, f"#{idx} {username} - Pulls: {pulls}\n")
+        age = datetime.datetime.now() - datetime.datetime.fromtimestamp(os.path.getmtime(METRICS_FILE))
+        self.output.insert(tk.END, f"Command metrics (updated {int(age.total_seconds())}s ago):\n")
+        for row in sorted(rows, key=lambda row: -row["calls"]):
+            self.output.insert(tk.END, f"/{row['command']}: {row['calls']} calls, {row['errors']} errors, "
+                                       f"avg {row['avg_ms']:.1f} ms, p95 <={row['p95_ms']:.0f} ms, "
+                                       f"SQL {row['sql_ms']:.2f} ms, {row['statements']:.1f} stmts, {row['api_calls']:.1f} API calls\n")
+
     def admin_give_item(self):
         user_id = simpledialog.askinteger("User ID", "Enter the user ID:")
         if user_id is None:
@@ -228,42 +497,13 @@ class ControlPanel(tk.Tk):
         amount = simpledialog.askinteger("Amount", "Enter the amount:")
         if not amount:
             amount = 1
-        # Find rarity
-        rarity = None
-        items = [
-            ("laser pointer", "common"),
-            ("cappy", "common"),
-            ("ó", "uncommon"),
-            ("gljj", "uncommon"),
-            ("cheese cup", "rare"),
-            ("hammer", "rare"),
-            ("gumball", "epic"),
-            ("confetti cannon", "epic"),
-            ("toothpick", "legendary"),
-            ("glimmer", "legendary"),
-            ("outlet", "mythic"),
-            ("button", "mythic"),
-            ("floppy disc", "divine"),
-            ("pocket watch", "divine"),
-            ("fork", "secret"),
-            ("aciddrop", "secret"),
-        ]
-        for i, r in items:
-            if i.lower() == item.lower():
-                rarity = r
-                break
-        if not rarity:
-            messagebox.showerror("Error", "Item not found.")
-            return
-        self.c.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (user_id, str(user_id)))
-        self.c.execute("SELECT amount FROM inventory WHERE user_id = ? AND item = ?", (user_id, item))
-        row = self.c.fetchone()
-        if row:
-            self.c.execute("UPDATE inventory SET amount = amount + ? WHERE user_id = ? AND item = ?", (amount, user_id, item))
-        else:
-            self.c.execute("INSERT INTO inventory (user_id, item, rarity, amount) VALUES (?, ?, ?, ?)", (user_id, item, rarity, amount))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Gave {amount}x {item} ({rarity}) to user {user_id}.\n")
+        def done(result):
+            if not result:
+                messagebox.showerror("Error", "Item not found.")
+                return
+            name, rarity = result
+            self.log_output_line(f"Gave {amount}x {name} ({rarity}) to user {user_id}.")
+        self.run_query(give_named_item, user_id, item, amount, on_done=done)
 
     def admin_set_pulls(self):
         user_id = simpledialog.askinteger("User ID", "Enter the user ID:")
@@ -272,19 +512,45 @@ class ControlPanel(tk.Tk):
         pulls = simpledialog.askinteger("Pulls", "Enter the new pull count:")
         if pulls is None:
             return
-        self.c.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (user_id, str(user_id)))
-        self.c.execute("UPDATE users SET pulls = ? WHERE user_id = ?", (pulls, user_id))
-        self.conn.commit()
-        self.output.insert(tk.END, f"Set pulls for user {user_id} to {pulls}.\n")
+        self.run_query(set_pulls, user_id, pulls, on_done=lambda _: self.log_output_line(f"Set pulls for user {user_id} to {pulls}."))
+
+    def admin_bulk(self):
+        formats = "\n".join(f"{action}: {USAGE[action]}" for action in BULK_ACTIONS)
+        action = simpledialog.askstring("Bulk Update", f"Enter the action:\n{formats}")
+        if not action:
+            return
+        action = action.strip().lower()
+        if action not in BULK_ACTIONS:
+            messagebox.showerror("Error", f"Unknown action {action!r}.")
+            return
+        path = filedialog.askopenfilename(title=f"CSV for {action}", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, encoding="utf-8-sig") as f:
+                rows, failures = parse_bulk(action, f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("Error", f"Could not read {path}: {e}")
+            return
+        def done(result):
+            applied, rejected = result
+            errors = sorted(failures + rejected)
+            self.output.delete(1.0, tk.END)
+            self.log_output_line(f"Bulk {action} from {os.path.basename(path)}: applied {applied} rows, {len(errors)} failed.")
+            self.output.insert(tk.END, "".join(f"line {line}: {reason}\n" for line, reason in errors))
+        self.run_query(apply_bulk, action, rows, on_done=done)
 
     def start_bot(self):
         if self.bot_process and self.bot_process.poll() is None:
             messagebox.showinfo("Info", "Bot is already running.")
             return
-        with open(LOG_PATH, "w") as log_file:
+        self.reset_log_tail()
+        self.output_offset = 0
+        self.output_partial = b""
+        with open(BOT_OUTPUT_PATH, "w") as out_file:
             self.bot_process = subprocess.Popen([
                 "python3", BOT_PATH
-            ], stdout=log_file, stderr=subprocess.STDOUT)
+            ], stdout=out_file, stderr=subprocess.STDOUT, env=dict(os.environ, RNG_LOG_FILE=LOG_PATH))
         self.output.insert(tk.END, "Bot started.\n")
         self.schedule_log_update()
 
@@ -298,46 +564,99 @@ class ControlPanel(tk.Tk):
         self.bot_process = None
 
     def view_users(self):
-        self.output.delete(1.0, tk.END)
-        self.c.execute("SELECT user_id, username, pulls FROM users")
-        users = self.c.fetchall()
-        if not users:
-            self.output.insert(tk.END, "No users found.\n")
-            return
-        for user_id, username, pulls in users:
-            self.output.insert(tk.END, f"{username} (ID: {user_id}) - Pulls: {pulls}\n")
+        PagedTable(self, "Users", ("User ID", "Username", "Pulls"), fetch_users_page, key_of=lambda row: row[0])
 
     def view_inventory(self):
-        self.output.delete(1.0, tk.END)
         user_id = simpledialog.askinteger("User ID", "Enter the user ID:")
         if user_id is None:
             return
-        self.c.execute("SELECT item, rarity, amount FROM inventory WHERE user_id = ?", (user_id,))
-        items = self.c.fetchall()
-        if not items:
-            self.output.insert(tk.END, "No inventory for this user.\n")
-            return
-        for item, rarity, amount in items:
-            self.output.insert(tk.END, f"{item} ({rarity}) x{amount}\n")
+        PagedTable(self, f"Inventory of {user_id}", ("Item", "Rarity", "Amount"),
+                   lambda conn, after, limit: fetch_inventory_page(conn, user_id, after, limit), key_of=lambda row: row[0])
 
     def reset_data(self):
         if messagebox.askyesno("Confirm Reset", "Are you sure you want to reset all data? This cannot be undone."):
-            self.c.execute("DELETE FROM users")
-            self.c.execute("DELETE FROM inventory")
-            self.conn.commit()
-            self.output.delete(1.0, tk.END)
-            self.output.insert(tk.END, "All data has been reset.\n")
+            def done(_):
+                self.output.delete(1.0, tk.END)
+                self.output.insert(tk.END, "All data has been reset.\n")
+            self.run_query(reset_user_data, on_done=done)
 
-    def update_logs(self):
+    def reset_log_tail(self):
+        # Forget where we were in bot.log; the next update starts from the end of the new file
+        self.log_offset = None
+        self.log_file_id = None
+        self.log_head = b""
+        self.log_partial = b""
         self.log_output.config(state='normal')
         self.log_output.delete(1.0, tk.END)
-        if os.path.exists(LOG_PATH):
-            with open(LOG_PATH, "r") as f:
-                self.log_output.insert(tk.END, f.read())
         self.log_output.config(state='disabled')
 
+    def update_logs(self):
+        try:
+            st = os.stat(LOG_PATH)
+        except FileNotFoundError:
+            return
+        file_id = (st.st_dev, st.st_ino)
+        with open(LOG_PATH, "rb") as f:
+            head = f.read(len(self.log_head) or LOG_HEAD_BYTES)
+            # Rotated (new file) or truncated: start over.
+            # The head check catches a file that was truncated and has already regrown.
+            if self.log_offset is not None and (file_id != self.log_file_id or st.st_size < self.log_offset or head != self.log_head):
+                self.reset_log_tail()
+            if self.log_offset is None:
+                self.log_file_id = file_id
+                self.log_head = head[:LOG_HEAD_BYTES]
+                self.log_offset = max(0, st.st_size - LOG_INITIAL_BYTES)
+            if st.st_size == self.log_offset:
+                return
+            f.seek(self.log_offset)
+            data = f.read(LOG_READ_BYTES)
+            self.log_offset = f.tell()
+        data = self.log_partial + data
+        # Hold back an unfinished last line until the rest of it is written
+        cut = data.rfind(b"\n") + 1
+        self.log_partial = data[cut:]
+        if cut:
+            self.append_log_lines(format_log_line(line) for line in data[:cut].decode("utf-8", errors="replace").splitlines())
+
+    def update_bot_output(self):
+        # Polled before reading, so everything the bot wrote before exiting is shown first
+        exit_code = self.bot_process.poll() if self.bot_process else None
+        try:
+            with open(BOT_OUTPUT_PATH, "rb") as f:
+                f.seek(self.output_offset)
+                data = self.output_partial + f.read(LOG_READ_BYTES)
+                self.output_offset = f.tell()
+        except FileNotFoundError:
+            data = b""
+        cut = data.rfind(b"\n") + 1
+        self.output_partial = data[cut:]
+        lines = data[:cut].decode("utf-8", errors="replace").splitlines()
+        if exit_code is not None:
+            if self.output_partial:
+                lines.append(self.output_partial.decode("utf-8", errors="replace"))
+                self.output_partial = b""
+            self.output.insert(tk.END, f"Bot exited with code {exit_code}; see the bot log.\n")
+            self.bot_process = None
+        if lines:
+            self.append_log_lines(lines)
+
+    def append_log_lines(self, lines):
+        at_bottom = self.log_output.yview()[1] >= 0.999
+        self.log_output.config(state='normal')
+        self.log_output.insert(tk.END, "".join(line + "\n" for line in lines))
+        # We only ever insert whole lines, so the last line of the widget is empty
+        count = int(self.log_output.index("end-1c").split(".")[0]) - 1
+        if count > LOG_MAX_LINES:
+            self.log_output.delete("1.0", f"{count - LOG_MAX_LINES + 1}.0")
+        self.log_output.config(state='disabled')
+        if at_bottom:
+            self.log_output.see(tk.END)
+
     def schedule_log_update(self):
+        if self.log_updater:
+            self.after_cancel(self.log_updater)
         self.update_logs()
+        self.update_bot_output()
         self.log_updater = self.after(2000, self.schedule_log_update)
 
     def on_closing(self):
@@ -345,6 +664,8 @@ class ControlPanel(tk.Tk):
             self.stop_bot()
         if self.log_updater:
             self.after_cancel(self.log_updater)
+        self.after_cancel(self.result_poller)
+        self.worker.close()
         self.destroy()
 
 if __name__ == "__main__":
@@ -0,0 +1,438 @@
+"""Game state shared by the Discord bot and the CLI: the database, item catalogue, RNG stream and pull bookkeeping.
+
+No Discord code here, so `python main.py --cli` and the batch tools never import discord.py.
+Importing this module opens the database and loads the catalogue.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+
+from db import Database, DB_PATH, init_schema, schema_is_current
+from catalogue import ItemCatalogue, get_rarity_id, pool_version_recorded, record_pool_version
+from migrations import migrate
+from players import UPSERT_INVENTORY, get_user_data_version, score_new_items
+from game import ACHIEVEMENTS, ACHIEVEMENT_INPUTS, RARITY_WEIGHTS, RARITY_ORDER, RARITY_STATS
+from write_behind import WriteBehindQueue
+from rng import start_stream
+from metrics import metrics, instrument_database, startup
+
+log = logging.getLogger("rng.core")
+
+# --- Database setup ---
+# All queries go through db.read()/db.write() so the event loop never blocks on SQLite.
+db = Database(DB_PATH)
+
+# Helper to get user achievement ids
+def get_user_achievements(conn, user_id):
+    rows = conn.execute("SELECT achievement FROM achievements WHERE user_id = ?", (user_id,)).fetchall()
+    return set(row[0] for row in rows)
+
+ACHIEVEMENTS_BY_STAT = {}
+for _index, _achievement in enumerate(ACHIEVEMENTS):
+    for _stat in ACHIEVEMENT_INPUTS[_achievement[0]]:
+        ACHIEVEMENTS_BY_STAT.setdefault(_stat, []).append(_index)
+
+def award_achievements(state, changed):
+    # Unlocks are recorded on the in-memory state; the pull event carries them to the database
+    candidates = set()
+    for stat in changed:
+        candidates.update(ACHIEVEMENTS_BY_STAT.get(stat, ()))
+    awarded = []
+    # Indexes into ACHIEVEMENTS, so unlocks are reported in declaration order
+    for index in sorted(candidates):
+        aid, name, desc, cond = ACHIEVEMENTS[index]
+        if aid not in state.achievements and cond(state.stats):
+            state.achievements.add(aid)
+            awarded.append((aid, name, desc))
+    return awarded
+
+
+def claim_reward(conn, user_id, username, column, period, amount):
+    # column is always one of our own last_daily/last_weekly names, never user input
+    row = conn.execute(f"SELECT coins, {column} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if not row:
+        conn.execute(f"INSERT INTO users (user_id, username, coins, {column}) VALUES (?, ?, ?, ?) ", (user_id, username, amount, period))
+        return amount
+    coins, last_claim = row
+    if last_claim == period:
+        return None
+    coins = (coins or 0) + amount
+    conn.execute(f"UPDATE users SET coins = ?, {column} = ? WHERE user_id = ?", (coins, period, user_id))
+    return coins
+
+
+# --- Items and rarities ---
+
+# --- Item pool is now stored in the database ---
+# Default items (only insert if table is empty)
+def seed_default_items(conn):
+    if conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0:
+        default_items = [
+            ("laser pointer", "common"),
+            ("cappy", "common"),
+            ("ó", "uncommon"),
+            ("gljj", "uncommon"),
+            ("cheese cup", "rare"),
+            ("hammer", "rare"),
+            ("gumball", "epic"),
+            ("confetti cannon", "epic"),
+            ("toothpick", "legendary"),
+            ("glimmer", "legendary"),
+            ("outlet", "mythic"),
+            ("button", "mythic"),
+            ("floppy disc", "divine"),
+            ("pocket watch", "divine"),
+            ("fork", "secret"),
+            ("aciddrop", "secret"),
+        ]
+        conn.executemany("INSERT INTO items (item, rarity_id) VALUES (?, ?)", [(item, get_rarity_id(conn, rarity)) for item, rarity in default_items])
+
+def is_seeded(conn):
+    # The control panel creates and migrates the schema but never seeds it, so a current schema
+    # alone doesn't mean the default items and pool version 0 are there
+    return conn.execute("SELECT 1 FROM items LIMIT 1").fetchone() is not None and pool_version_recorded(conn)
+
+def bootstrap(run_write):
+    """Create or upgrade the schema and seed a new database. Idempotent; skipped at startup when already done."""
+    run_write(init_schema)
+    migrate(run_write)
+    run_write(seed_default_items)
+    run_write(record_pool_version)
+
+if db.read_sync(schema_is_current) and db.read_sync(is_seeded):
+    log.info("Schema is current, skipping bootstrap.")
+else:
+    bootstrap(db.write_sync)
+instrument_database(db)
+startup.mark("schema")
+
+# --- Item catalogue ---
+# Loaded once and kept in memory; admin commands reload it right after editing, and
+# edits made elsewhere (the control panel) bump the version stamp that poll_catalogue() watches.
+catalogue = ItemCatalogue(RARITY_WEIGHTS)
+db.read_sync(catalogue.reload)
+startup.mark("catalogue")
+CATALOGUE_POLL_SECONDS = float(os.getenv("RNG_CATALOGUE_POLL_SECONDS", "5"))
+
+async def reload_catalogue():
+    return await db.read(catalogue.reload)
+
+async def poll_catalogue():
+    while True:
+        await asyncio.sleep(CATALOGUE_POLL_SECONDS)
+        try:
+            await db.read(catalogue.refresh)
+        except Exception as e:
+            log.warning("Failed to refresh item catalogue: %s", e)
+
+# --- RNG stream ---
+# Pre-drawn uniforms from a seedable stream (RNG_SEED); every pull records its stream position for replay.
+rng_stream = start_stream(db)
+startup.mark("rng_stream")
+
+
+def get_meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_meta(conn, key, value):
+    conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+
+UPSERT_USER_PULLS = (
+    "INSERT INTO users (user_id, username, pulls) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET pulls = pulls + excluded.pulls"
+)
+UPSERT_RARITY_PULLS = (
+    "INSERT INTO user_rarity_pulls (user_id, rarity_id, pulls) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id, rarity_id) DO UPDATE SET pulls = pulls + excluded.pulls"
+)
+
+INSERT_PULL_HISTORY = (
+    "INSERT INTO pull_history (user_id, item_id, ts, pool_version, stream_id, rng_pos) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+def pull_history_rows(user_id, draws, snapshot, stream_id, rng_pos):
+    # One row per draw, in draw order; ids and version come from the snapshot the draws were made from,
+    # and draw i used the uniform at rng_pos + i
+    ts = int(time.time() * 1000)
+    items = snapshot.items
+    return [(user_id, items[item].item_id, ts, snapshot.version, stream_id, rng_pos + i) for i, (item, _) in enumerate(draws)]
+
+def id_counts(counts, snapshot):
+    # {(item, rarity): n} -> {(item_id, rarity_id): n}, the keys the database stores
+    items = snapshot.items
+    return Counter({(items[item].item_id, items[item].rarity_id): amount for (item, _), amount in counts.items()})
+
+def apply_pulls(conn, user_id, username, draws, snapshot, stream_id, rng_pos):
+    """Record a batch of (item, rarity) draws for one user in a single transaction."""
+    counts = Counter(draws)
+    ids = id_counts(counts, snapshot)
+    rarity_counts = Counter()
+    for (_, rarity_id), amount in ids.items():
+        rarity_counts[rarity_id] += amount
+    conn.execute(UPSERT_USER_PULLS, (user_id, username, len(draws)))
+    score_new_items(conn, [(user_id, item_id) for item_id, _ in ids])
+    conn.executemany(UPSERT_INVENTORY, [(user_id, item_id, amount) for (item_id, _), amount in ids.items()])
+    conn.executemany(UPSERT_RARITY_PULLS, [(user_id, rarity_id, amount) for rarity_id, amount in rarity_counts.items()])
+    conn.executemany(INSERT_PULL_HISTORY, pull_history_rows(user_id, draws, snapshot, stream_id, rng_pos))
+    return counts
+
+class UserState:
+    """In-memory view of a user's pull stats, ahead of whatever the write-behind queue has flushed."""
+    __slots__ = ("stats", "rarity_pulls", "achievements")
+
+    def __init__(self, pulls, rarity_pulls, achievements):
+        self.rarity_pulls = rarity_pulls
+        self.achievements = achievements
+        self.stats = {"pulls": pulls, "rares": 0, "legendaries": 0}
+        for rarity, amount in rarity_pulls.items():
+            if rarity in RARITY_STATS:
+                self.stats[RARITY_STATS[rarity]] += amount
+
+    def add_pulls(self, rarity_counts):
+        """Bump the counters for one batch of pulls and return the names of the stats that changed."""
+        changed = {"pulls"}
+        for rarity, amount in rarity_counts.items():
+            self.rarity_pulls[rarity] = self.rarity_pulls.get(rarity, 0) + amount
+            self.stats["pulls"] += amount
+            if rarity in RARITY_STATS:
+                self.stats[RARITY_STATS[rarity]] += amount
+                changed.add(RARITY_STATS[rarity])
+        return changed
+
+def load_user_state(conn, user_id):
+    # Primary-key lookups only: the counters are kept up to date by every pull write
+    row = conn.execute("SELECT pulls FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    rarity_pulls = dict(conn.execute(
+        "SELECT r.name, p.pulls FROM user_rarity_pulls p JOIN rarities r ON r.rarity_id = p.rarity_id WHERE p.user_id = ?",
+        (user_id,),
+    ).fetchall())
+    return UserState(row[0] if row else 0, rarity_pulls, get_user_achievements(conn, user_id))
+
+# Most recently pulling users first out; an evicted user is simply loaded again
+USER_STATE_CACHE_SIZE = int(os.getenv("RNG_USER_STATE_CACHE_SIZE", "10000"))
+USER_DATA_POLL_SECONDS = float(os.getenv("RNG_USER_DATA_POLL_SECONDS", "5"))
+user_states = OrderedDict()
+user_state_loads = {}
+
+async def read_user_state(user_id):
+    # Pulls still queued for this user (from before an eviction or invalidation) must reach
+    # the database first, or the reload misses them and re-awards their achievements
+    if any(event[0] == user_id for event in write_behind.queued()):
+        await write_behind.flush()
+    return await db.read(load_user_state, user_id)
+
+async def get_user_state(user_id):
+    state = user_states.get(user_id)
+    if state is not None:
+        user_states.move_to_end(user_id)
+        return state
+    # Concurrent pulls for a user that is not cached yet share a single load
+    load = user_state_loads.get(user_id)
+    if load is None:
+        load = user_state_loads[user_id] = asyncio.ensure_future(read_user_state(user_id))
+    try:
+        state = await load
+    finally:
+        current = user_state_loads.get(user_id) is load
+        if current:
+            user_state_loads.pop(user_id)
+    if not current:
+        # Invalidated while loading: the rows it read may already be stale, so don't cache them
+        return state
+    state = user_states.setdefault(user_id, state)
+    while len(user_states) > USER_STATE_CACHE_SIZE:
+        user_states.popitem(last=False)
+    return state
+
+def invalidate_user_states(user_ids=None):
+    """Drop cached states after a write that changed their rows (None: every user).
+
+    Flush write_behind before that write, or pulls queued earlier land on top of it.
+    """
+    if user_ids is None:
+        user_states.clear()
+        user_state_loads.clear()
+    else:
+        for user_id in user_ids:
+            user_states.pop(user_id, None)
+            user_state_loads.pop(user_id, None)
+
+async def poll_user_data():
+    # Admin writes from outside the bot (the control panel, bulk.py) bump the user data stamp
+    version = await db.read(get_user_data_version)
+    while True:
+        await asyncio.sleep(USER_DATA_POLL_SECONDS)
+        try:
+            latest = await db.read(get_user_data_version)
+        except Exception as e:
+            log.warning("Failed to check for user data edits: %s", e)
+            continue
+        if latest != version:
+            version = latest
+            invalidate_user_states()
+
+def flush_pull_events(conn, events):
+    users = {}
+    inventory_rows = Counter()
+    rarity_rows = Counter()
+    unlocked = []
+    history = []
+    for user_id, username, counts, awarded, date, rows in events:
+        _, pulls = users.get(user_id, (username, 0))
+        users[user_id] = (username, pulls + sum(counts.values()))
+        for (item_id, rarity_id), amount in counts.items():
+            inventory_rows[(user_id, item_id)] += amount
+            rarity_rows[(user_id, rarity_id)] += amount
+        unlocked.extend((user_id, aid, date) for aid in awarded)
+        history.extend(rows)
+    conn.executemany(UPSERT_USER_PULLS, [(user_id, username, pulls) for user_id, (username, pulls) in users.items()])
+    score_new_items(conn, list(inventory_rows))
+    conn.executemany(UPSERT_INVENTORY, [(user_id, item_id, amount) for (user_id, item_id), amount in inventory_rows.items()])
+    conn.executemany(UPSERT_RARITY_PULLS, [(user_id, rarity_id, amount) for (user_id, rarity_id), amount in rarity_rows.items()])
+    conn.executemany("INSERT OR IGNORE INTO achievements (user_id, achievement, date) VALUES (?, ?, ?)", unlocked)
+    conn.executemany(INSERT_PULL_HISTORY, history)
+
+# Durability window: pulls are acknowledged immediately and reach disk within this many ms
+FLUSH_WINDOW_MS = int(os.getenv("RNG_FLUSH_WINDOW_MS", "50"))
+FLUSH_MAX_EVENTS = int(os.getenv("RNG_FLUSH_MAX_EVENTS", "500"))
+write_behind = WriteBehindQueue(db, flush_pull_events, window=FLUSH_WINDOW_MS / 1000, max_batch=FLUSH_MAX_EVENTS)
+
+async def record_pulls(user_id, username, draws, snapshot, stream_id, rng_pos):
+    """Apply draws to the user's in-memory state now and queue the database write."""
+    state = await get_user_state(user_id)
+    counts = Counter(draws)
+    rarity_counts = Counter()
+    for (_, rarity), amount in counts.items():
+        rarity_counts[rarity] += amount
+    awarded = award_achievements(state, state.add_pulls(rarity_counts))
+    write_behind.put((user_id, username, id_counts(counts, snapshot), [aid for aid, _, _ in awarded], datetime.datetime.now().isoformat(),
+                      pull_history_rows(user_id, draws, snapshot, stream_id, rng_pos)))
+    return counts, awarded
+
+def summarize_pulls(counts):
+    # Rarest first, then by name
+    def key(entry):
+        (item, rarity), _ = entry
+        tier = RARITY_ORDER.index(rarity) if rarity in RARITY_ORDER else -1
+        return (-tier, item)
+    return sorted(counts.items(), key=key)
+
+
+def get_inventory(conn, user_id):
+    # Names and rarities come from the items table, so a rarity edit shows up in every inventory at once
+    return conn.execute("""
+        SELECT i.item, r.name, inv.amount FROM inventory inv
+        JOIN items i ON i.item_id = inv.item_id
+        JOIN rarities r ON r.rarity_id = i.rarity_id
+        WHERE inv.user_id = ? ORDER BY r.tier DESC, i.item
+    """, (user_id,)).fetchall()
+
+def get_inventory_details(snapshot, rows):
+    # Descriptions and images come from the catalogue; retired items have neither
+    details = []
+    for item, rarity, amount in rows:
+        info = snapshot.get(item)
+        if info:
+            details.append((item, info.rarity, amount, info.description, info.image))
+        else:
+            details.append((item, rarity, amount, None, None))
+    return details
+
+
+def get_pulls(conn, user_id):
+    row = conn.execute("SELECT pulls FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+# --- Leaderboards ---
+LEADERBOARD_SIZE = 10
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("RNG_LEADERBOARD_REFRESH_SECONDS", "60"))
+LEADERBOARD_TITLES = {"pulls": "Pulls", "coins": "Coins", "collection": "Collection Score"}
+
+# Board name -> (refreshed at, [(user_id, username, value), ...]); replaced whole on refresh
+leaderboards = {}
+
+def get_leaderboard_top(conn, board, limit):
+    if board == "collection":
+        return conn.execute("""
+            SELECT s.user_id, u.username, s.score FROM collection_scores s
+            LEFT JOIN users u ON u.user_id = s.user_id
+            ORDER BY s.score DESC LIMIT ?
+        """, (limit,)).fetchall()
+    # board is one of our own column names, never user input
+    return conn.execute(f"SELECT user_id, username, {board} FROM users ORDER BY {board} DESC LIMIT ?", (limit,)).fetchall()
+
+def get_user_ranks(conn, user_id):
+    # Ranks are 1 + how many users are strictly ahead, answered from the indexes
+    row = conn.execute("SELECT pulls, coins FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    ranks = {}
+    if row:
+        pulls, coins = row[0] or 0, row[1] or 0
+        ranks["pulls"] = (pulls, conn.execute("SELECT COUNT(*) FROM users WHERE pulls > ?", (pulls,)).fetchone()[0] + 1)
+        ranks["coins"] = (coins, conn.execute("SELECT COUNT(*) FROM users WHERE coins > ?", (coins,)).fetchone()[0] + 1)
+    score_row = conn.execute("SELECT score FROM collection_scores WHERE user_id = ?", (user_id,)).fetchone()
+    if score_row:
+        score = score_row[0]
+        ranks["collection"] = (score, conn.execute("SELECT COUNT(*) FROM collection_scores WHERE score > ?", (score,)).fetchone()[0] + 1)
+    return ranks
+
+async def refresh_leaderboards():
+    # Scores are kept current by every inventory write, so a refresh only reads the top of each index
+    await write_behind.flush()
+    now = datetime.datetime.now()
+    for board in LEADERBOARD_TITLES:
+        leaderboards[board] = (now, await db.read(get_leaderboard_top, board, LEADERBOARD_SIZE))
+
+async def poll_leaderboards():
+    while True:
+        try:
+            await refresh_leaderboards()
+        except Exception as e:
+            log.warning("Failed to refresh leaderboards: %s", e)
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+
+# --- Drop-rate audit ---
+def get_observed_drops(conn, version, since_ms):
+    # Aggregated in SQLite straight off the covering ts index; only one row per item comes back
+    return conn.execute(
+        "SELECT item_id, COUNT(*) FROM pull_history WHERE ts >= ? AND pool_version = ? GROUP BY item_id",
+        (since_ms, version),
+    ).fetchall()
+
+def drop_rate_report(snapshot, observed_rows):
+    """Observed vs expected pulls per rarity, plus a chi-square statistic and its approximate 95% critical value."""
+    expected = Counter()
+    for (_, rarity), probability in snapshot.sampler.probabilities().items():
+        expected[rarity] += probability
+    rarity_by_id = {info.item_id: info.rarity for info in snapshot.items.values()}
+    observed = Counter()
+    for item_id, pulls in observed_rows:
+        if item_id in rarity_by_id:
+            observed[rarity_by_id[item_id]] += pulls
+    total = sum(observed.values())
+    rows = []
+    chi2 = 0.0
+    for rarity in sorted(expected, key=lambda r: RARITY_ORDER.index(r) if r in RARITY_ORDER else len(RARITY_ORDER)):
+        want = expected[rarity] * total
+        if want:
+            chi2 += (observed[rarity] - want) ** 2 / want
+        rows.append((rarity, observed[rarity], observed[rarity] / total if total else 0.0, expected[rarity]))
+    df = max(1, len(rows) - 1)
+    # Wilson-Hilferty approximation of the chi-square 95th percentile
+    critical = df * (1 - 2 / (9 * df) + 1.645 * (2 / (9 * df)) ** 0.5) ** 3
+    return rows, total, chi2, critical, df
+
+
+metrics.add_gauge_source(lambda: {f"rng_write_behind_{key}": value for key, value in write_behind.stats().items()})
+
+
+def close():
+    rng_stream.close()
+    db.close()
@@ -0,0 +1,365 @@
+
+import asyncio
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from game import RARITY_ORDER
+
+log = logging.getLogger("rng.db")
+
+
+DB_PATH = os.getenv("RNG_DB_PATH", "rng_game.db")
+
+# --- Connection tuning (override from the environment / .env) ---
+DB_SYNCHRONOUS = os.getenv("RNG_DB_SYNCHRONOUS", "NORMAL").upper()
+DB_BUSY_TIMEOUT_MS = int(os.getenv("RNG_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("RNG_DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("RNG_DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_JOURNAL_SIZE_LIMIT = int(os.getenv("RNG_DB_JOURNAL_SIZE_LIMIT", str(64 * 1024 * 1024)))
+DB_CHECKPOINT_SECONDS = float(os.getenv("RNG_DB_CHECKPOINT_SECONDS", "300"))
+DB_BUSY_RETRIES = int(os.getenv("RNG_DB_BUSY_RETRIES", "5"))
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def connect(path=DB_PATH, check_same_thread=True):
+    """Open rng_game.db the same way from the bot and the control panel.
+
+    WAL lets panel reads run alongside the bot's writer, and busy_timeout
+    makes a writer wait for the lock instead of failing straight away.
+    """
+    if DB_SYNCHRONOUS not in SYNCHRONOUS_MODES:
+        raise ValueError(f"RNG_DB_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}")
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=check_same_thread)
+    retry_on_busy(conn.execute, "PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA journal_size_limit={DB_JOURNAL_SIZE_LIMIT}")
+    return conn
+
+
+def is_busy_error(e):
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e))
+
+
+def retry_on_busy(fn, *args, retries=DB_BUSY_RETRIES, base_delay=0.05):
+    """Call fn, retrying "database is locked" errors with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == retries:
+                raise
+            time.sleep(base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+
+def checkpoint(conn, mode="PASSIVE"):
+    # Returns (busy, wal_pages, checkpointed_pages)
+    return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+
+# Bumped by every migration in migrations.py, and by any other change to init_schema: a database that
+# already records this version skips init_schema at startup. 1: inventory and counters keyed by
+# item/rarity name; 2: integer item and rarity ids; 3: collection scores kept up to date by every write.
+SCHEMA_VERSION = 3
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def is_legacy_schema(conn):
+    # Schema version 1 keyed inventory rows by item name; migrations.py converts it in place
+    return "item" in table_columns(conn, "inventory")
+
+
+def create_items_table(conn):
+    # item_id is an explicit INTEGER PRIMARY KEY so ids survive VACUUM; pull_history and
+    # item_pool_versions refer to it. Removed items are retired, not deleted, so inventories keep them.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS items (
+        item_id INTEGER PRIMARY KEY,
+        item TEXT NOT NULL UNIQUE,
+        rarity_id INTEGER NOT NULL REFERENCES rarities (rarity_id),
+        description TEXT,
+        image TEXT,
+        retired INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+
+def create_inventory_table(conn, name="inventory"):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {name} (
+        user_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY (user_id, item_id)
+    ) WITHOUT ROWID
+    """)
+
+
+def create_rarity_pulls_table(conn, name="user_rarity_pulls"):
+    # Per-user pull counters by rarity, updated in the same transaction as each pull
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {name} (
+        user_id INTEGER NOT NULL,
+        rarity_id INTEGER NOT NULL,
+        pulls INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, rarity_id)
+    ) WITHOUT ROWID
+    """)
+
+
+def init_schema(conn):
+    legacy = is_legacy_schema(conn)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS achievements (
+        user_id INTEGER,
+        achievement TEXT,
+        date TEXT,
+        PRIMARY KEY (user_id, achievement)
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        pulls INTEGER DEFAULT 0,
+        coins INTEGER DEFAULT 0,
+        last_daily TEXT,
+        last_weekly TEXT
+    )
+    """)
+    # Rarity names and their tiers (0 = common, rarest highest); names outside RARITY_ORDER get tier -1
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rarities (
+        rarity_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        tier INTEGER NOT NULL
+    )
+    """)
+    conn.executemany(
+        "INSERT INTO rarities (name, tier) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET tier = excluded.tier",
+        [(rarity, tier) for tier, rarity in enumerate(RARITY_ORDER)],
+    )
+    # An older database keeps its name-keyed tables until migrations.py converts them
+    if not legacy:
+        create_items_table(conn)
+        create_inventory_table(conn)
+        create_rarity_pulls_table(conn)
+    # Item pool version stamp, bumped on every pool edit so cached samplers know to rebuild
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # Leaderboards: indexed sort columns plus a collection score kept current by every inventory write
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_pulls ON users (pulls)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_coins ON users (coins)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS collection_scores (
+        user_id INTEGER PRIMARY KEY,
+        score INTEGER NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_collection_scores_score ON collection_scores (score)")
+    # Append-only audit log, one row per drawn item. item_id is items.rowid and ts is unix milliseconds.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS pull_history (
+        user_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        pool_version INTEGER NOT NULL
+    )
+    """)
+    # Where each pull's uniform came from in the RNG stream (see rng.py); NULL for pulls made before streams
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(pull_history)")}
+    if "rng_pos" not in columns:
+        conn.execute("ALTER TABLE pull_history ADD COLUMN stream_id INTEGER")
+        conn.execute("ALTER TABLE pull_history ADD COLUMN rng_pos INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pull_history_user_ts ON pull_history (user_id, ts)")
+    # Covers the drop-rate report, so it never has to touch the table itself
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pull_history_ts ON pull_history (ts, pool_version, item_id)")
+    # Seeded uniform streams; next_block is reserved before a block is used so no block is ever handed out twice
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rng_streams (
+        stream_id INTEGER PRIMARY KEY,
+        seed INTEGER NOT NULL,
+        engine TEXT NOT NULL,
+        block_size INTEGER NOT NULL,
+        next_block INTEGER NOT NULL DEFAULT 0,
+        created TEXT,
+        UNIQUE (seed, engine, block_size)
+    )
+    """)
+    # Local item images by content hash: the thumbnail on disk and its uploaded attachment URL
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS image_cache (
+        digest TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        thumb TEXT NOT NULL,
+        url TEXT,
+        expires INTEGER
+    )
+    """)
+    # The item pool at every catalogue version, for replaying old pulls
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS item_pool_versions (
+        version INTEGER PRIMARY KEY,
+        pool TEXT NOT NULL
+    )
+    """)
+    # One row per applied migration; a new database starts at the current version
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied TEXT NOT NULL
+    )
+    """)
+    if get_schema_version(conn) == 0:
+        version, name = (1, "baseline") if legacy else (SCHEMA_VERSION, "initial")
+        set_schema_version(conn, version, name)
+
+
+def get_schema_version(conn):
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def schema_is_current(conn):
+    """True when init_schema and the migrations have nothing to do: read-only, so startup can skip them."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone() is None:
+        return False
+    if get_schema_version(conn) != SCHEMA_VERSION:
+        return False
+    # init_schema also keeps the rarity tiers in step with game.RARITY_ORDER
+    tiers = [name for name, in conn.execute("SELECT name FROM rarities WHERE tier >= 0 ORDER BY tier")]
+    return tiers == list(RARITY_ORDER)
+
+
+def set_schema_version(conn, version, name):
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_version (version, name, applied) VALUES (?, ?, datetime('now'))",
+        (version, name),
+    )
+
+
+class Database:
+    """Runs SQLite work off the asyncio event loop.
+
+    Jobs are plain functions that take a connection as their first argument.
+    Writes are serialised on one writer thread and each job runs in its own
+    transaction; reads run on a small thread pool where every thread has its
+    own connection, so no cursor is ever shared between callers.
+    """
+
+    def __init__(self, path=DB_PATH, readers=2, checkpoint_seconds=DB_CHECKPOINT_SECONDS):
+        self.path = path
+        self.checkpoint_seconds = checkpoint_seconds
+        self._writes = queue.Queue()
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._reader_conns = []
+        self._reader_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
+    def connect(self):
+        # Each connection is only ever used by one thread; close() may run on another
+        return connect(self.path, check_same_thread=False)
+
+    def _run_write(self, conn, fn, args):
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _write_loop(self):
+        conn = self.connect()
+        next_checkpoint = time.monotonic() + self.checkpoint_seconds
+        try:
+            while True:
+                try:
+                    job = self._writes.get(timeout=max(0.0, next_checkpoint - time.monotonic()))
+                except queue.Empty:
+                    job = False
+                if job is None:
+                    break
+                if job:
+                    fn, args, future = job
+                    if future.set_running_or_notify_cancel():
+                        try:
+                            result = retry_on_busy(self._run_write, conn, fn, args)
+                        except BaseException as e:
+                            future.set_exception(e)
+                        else:
+                            future.set_result(result)
+                # Keep the WAL from growing without bound, even under constant load
+                if time.monotonic() >= next_checkpoint:
+                    try:
+                        checkpoint(conn)
+                    except sqlite3.Error as e:
+                        log.warning("WAL checkpoint failed: %s", e)
+                    next_checkpoint = time.monotonic() + self.checkpoint_seconds
+            checkpoint(conn, "TRUNCATE")
+        finally:
+            conn.close()
+
+    def _reader_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def _run_read(self, fn, args):
+        conn = self._reader_conn()
+        try:
+            return retry_on_busy(fn, conn, *args)
+        finally:
+            # Never hold a read transaction open between jobs
+            if conn.in_transaction:
+                conn.rollback()
+
+    def submit_write(self, fn, *args):
+        future = Future()
+        self._writes.put((fn, args, future))
+        return future
+
+    def submit_read(self, fn, *args):
+        return self._readers.submit(self._run_read, fn, args)
+
+    async def write(self, fn, *args):
+        return await asyncio.wrap_future(self.submit_write(fn, *args))
+
+    async def read(self, fn, *args):
+        return await asyncio.wrap_future(self.submit_read(fn, *args))
+
+    def write_sync(self, fn, *args):
+        return self.submit_write(fn, *args).result()
+
+    def read_sync(self, fn, *args):
+        return self.submit_read(fn, *args).result()
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
@@ -0,0 +1,44 @@
+
+"""Game rules shared by the bot, the CLI and the offline tools. No Discord or database code here."""
+
+# --- Rarities ---
+RARITY_WEIGHTS = {
+    "common": 40,
+    "uncommon": 25,
+    "rare": 15,
+    "epic": 8,
+    "legendary": 5,
+    "mythic": 3,
+    "divine": 2,
+    "secret": 1,
+}
+
+# Rarest last
+RARITY_ORDER = list(RARITY_WEIGHTS)
+
+RARE_RARITIES = ("rare", "epic")
+LEGENDARY_RARITIES = ("legendary", "mythic", "divine", "secret")
+# Derived achievement stats fed by each rarity's pull counter
+RARITY_STATS = {rarity: "rares" for rarity in RARE_RARITIES}
+RARITY_STATS.update({rarity: "legendaries" for rarity in LEGENDARY_RARITIES})
+# Collection score: each distinct item owned scores more the rarer its rarity is (common = 1)
+RARITY_POINTS = {rarity: max(1, round(max(RARITY_WEIGHTS.values()) / weight)) for rarity, weight in RARITY_WEIGHTS.items()}
+
+# --- Achievements ---
+# List of achievements: (id, name, description, condition function)
+ACHIEVEMENTS = [
+    ("first_pull", "First Pull!", "Pull any item for the first time.", lambda stats: stats.get("pulls", 0) >= 1),
+    ("ten_pulls", "Ten Pulls!", "Pull 10 items.", lambda stats: stats.get("pulls", 0) >= 10),
+    ("hundred_pulls", "Hundred Pulls!", "Pull 100 items.", lambda stats: stats.get("pulls", 0) >= 100),
+    ("rare_pull", "Rare Find!", "Pull a rare or higher item.", lambda stats: stats.get("rares", 0) >= 1),
+    ("legendary_pull", "Legendary!", "Pull a legendary or higher item.", lambda stats: stats.get("legendaries", 0) >= 1),
+]
+
+# Stats each condition reads, so a pull only re-checks rules whose inputs changed
+ACHIEVEMENT_INPUTS = {
+    "first_pull": ("pulls",),
+    "ten_pulls": ("pulls",),
+    "hundred_pulls": ("pulls",),
+    "rare_pull": ("rares",),
+    "legendary_pull": ("legendaries",),
+}
@@ -0,0 +1,185 @@
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import time
+from urllib.parse import parse_qs, urlparse
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+log = logging.getLogger("rng.images")
+
+# Channel the bot uploads item images to once; their attachment URLs are then reused in embeds.
+# Without one, local images are attached to every message that shows them.
+IMAGE_CHANNEL_ID = int(os.getenv("RNG_IMAGE_CHANNEL_ID", "0"))
+# Thumbnails need Pillow (in requirements.txt); without it images are copied at full size
+THUMB_DIR = os.getenv("RNG_THUMB_DIR", "thumbnails")
+THUMB_MAX_SIZE = int(os.getenv("RNG_THUMB_MAX_SIZE", "512"))
+# Re-upload this long before a signed CDN URL runs out
+URL_REFRESH_MARGIN = int(os.getenv("RNG_IMAGE_URL_REFRESH_MARGIN", "3600"))
+
+
+def is_remote(image):
+    return image.startswith(("http://", "https://"))
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_thumbnail(path, digest):
+    """Shrink and recompress an image into THUMB_DIR; without Pillow the file is copied as-is."""
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    if Image is None:
+        target = os.path.join(THUMB_DIR, digest + os.path.splitext(path)[1].lower())
+        if not os.path.exists(target):
+            shutil.copyfile(path, target)
+        return target
+    target = os.path.join(THUMB_DIR, f"{digest}.webp")
+    if not os.path.exists(target):
+        with Image.open(path) as img:
+            img.thumbnail((THUMB_MAX_SIZE, THUMB_MAX_SIZE))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            tmp = target + ".tmp"
+            img.save(tmp, "WEBP", quality=85, method=6)
+        os.replace(tmp, target)
+    return target
+
+
+def url_expiry(url):
+    # Discord attachment URLs are signed with an ex=<hex unix time> parameter; None means no expiry
+    values = parse_qs(urlparse(url).query).get("ex")
+    try:
+        return int(values[0], 16) if values else None
+    except ValueError:
+        return None
+
+
+def prepare_image(path):
+    # File work only, so callers can keep it off the database writer
+    digest = file_digest(path)
+    return digest, make_thumbnail(path, digest)
+
+
+def discord_file(path, digest):
+    # Imported here so the control panel can ingest images without discord.py
+    import discord
+
+    return discord.File(path, filename=digest[:16] + os.path.splitext(path)[1])
+
+
+# --- image_cache rows (run through Database jobs or the panel's worker) ---
+
+def record_image(conn, path, digest, thumb):
+    """Record a prepared image; drops rows for older versions of the same file."""
+    conn.execute(
+        "INSERT INTO image_cache (digest, source, thumb) VALUES (?, ?, ?) "
+        "ON CONFLICT(digest) DO UPDATE SET source = excluded.source, thumb = excluded.thumb",
+        (digest, path, thumb),
+    )
+    conn.execute("DELETE FROM image_cache WHERE source = ? AND digest != ?", (path, digest))
+
+
+def get_cached_image(conn, digest):
+    return conn.execute("SELECT thumb, url, expires FROM image_cache WHERE digest = ?", (digest,)).fetchone()
+
+
+def store_image_url(conn, digest, url, expires):
+    conn.execute("UPDATE image_cache SET url = ?, expires = ? WHERE digest = ?", (url, expires, digest))
+
+
+class ImageCache:
+    """Turns an item's image setting into something an embed can show.
+
+    URLs pass straight through. Local files are looked up by content hash: the
+    stat result is remembered so the file is only re-hashed when it changes, and
+    the uploaded attachment URL is reused until shortly before it expires.
+    """
+
+    def __init__(self, db, channel_id=IMAGE_CHANNEL_ID):
+        self.db = db
+        self.channel_id = channel_id
+        self._digests = {}  # path -> ((mtime_ns, size), digest, thumb)
+        self._urls = {}  # digest -> (url, expires)
+        self._uploads = {}  # digest -> future shared by concurrent callers
+
+    def _url_valid(self, entry):
+        return entry and entry[0] and (entry[1] is None or entry[1] - URL_REFRESH_MARGIN > time.time())
+
+    def is_ready(self, image):
+        """True when resolve() can answer without hashing, thumbnailing or uploading anything."""
+        if not image or is_remote(image):
+            return True
+        try:
+            st = os.stat(image)
+        except OSError:
+            return True  # resolve() gives up straight away
+        known = self._digests.get(image)
+        if not known or known[0] != (st.st_mtime_ns, st.st_size):
+            return False
+        return not self.channel_id or self._url_valid(self._urls.get(known[1]))
+
+    async def _local(self, path):
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        known = self._digests.get(path)
+        if known and known[0] == key:
+            return known[1], known[2]
+        # New or changed file: hash it and (re)build the thumbnail off the event loop
+        digest, thumb = await asyncio.to_thread(prepare_image, path)
+        await self.db.write(record_image, path, digest, thumb)
+        self._digests[path] = (key, digest, thumb)
+        return digest, thumb
+
+    async def _upload(self, client, digest, thumb):
+        channel = client.get_channel(self.channel_id) or await client.fetch_channel(self.channel_id)
+        message = await channel.send(file=discord_file(thumb, digest))
+        url = message.attachments[0].url
+        expires = url_expiry(url)
+        await self.db.write(store_image_url, digest, url, expires)
+        self._urls[digest] = (url, expires)
+        return url
+
+    async def resolve(self, client, image):
+        """Return (url, file): file is a discord.File to attach when url is an attachment:// reference."""
+        if not image or is_remote(image):
+            return image, None
+        try:
+            digest, thumb = await self._local(image)
+        except OSError as e:
+            log.warning("Item image %s is unavailable: %s", image, e)
+            return None, None
+        if self.channel_id:
+            cached = self._urls.get(digest)
+            if not self._url_valid(cached):
+                row = await self.db.read(get_cached_image, digest)
+                cached = self._urls[digest] = (row[1], row[2]) if row else None
+            if self._url_valid(cached):
+                return cached[0], None
+            upload = self._uploads.get(digest)
+            if upload is None:
+                upload = self._uploads[digest] = asyncio.ensure_future(self._upload(client, digest, thumb))
+                upload.add_done_callback(lambda _: self._uploads.pop(digest, None))
+            try:
+                return await asyncio.shield(upload), None
+            except Exception as e:
+                log.warning("Uploading item image %s failed, attaching it instead: %s", image, e)
+        try:
+            file = discord_file(thumb, digest)
+        except OSError as e:
+            # The thumbnail was removed since it was built: forget it so the next call rebuilds it
+            log.warning("Item image %s is unavailable: %s", image, e)
+            self._digests.pop(image, None)
+            return None, None
+        return f"attachment://{file.filename}", file
+
@@ -0,0 +1,160 @@
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+
+LOG_FILE = os.getenv("RNG_LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("RNG_LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("RNG_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("RNG_LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("RNG_LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_RECORDS = int(os.getenv("RNG_LOG_FLUSH_RECORDS", "200"))
+# Per-pull lines are the bulk of the log: raise the level (e.g. WARNING) to turn them off, or sample them
+PULL_LOG_LEVEL = os.getenv("RNG_PULL_LOG_LEVEL", "INFO").upper()
+PULL_LOG_SAMPLE = float(os.getenv("RNG_PULL_LOG_SAMPLE", "1.0"))
+
+PULL_LOGGER = "rng.pulls"
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """Log one structured event; fields become top-level keys of the JSON line."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Keeps roughly `rate` of the records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: when the writer falls behind, records are dropped and counted."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the message and traceback here (args may not be safe to touch later), keep the fields
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that only flushes when told to, so a burst is one write to disk."""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    def __init__(self, log_queue, *handlers, flush_records=LOG_FLUSH_RECORDS):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_records = flush_records
+        self.unflushed = 0
+
+    def handle(self, record):
+        super().handle(record)
+        self.unflushed += 1
+        # Flush once the burst is drained (or every flush_records lines during a long one)
+        if self.unflushed >= self.flush_records or self.queue.empty():
+            self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            getattr(handler, "flush_batch", handler.flush)()
+        self.unflushed = 0
+
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging(path=LOG_FILE, level=LOG_LEVEL, console=None):
+    """Route all logging (ours and discord.py's) through a queue to a background writer thread.
+
+    The file gets JSON lines and is rotated by size. Console output is plain text and is
+    on by default only when stderr is a terminal.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _queue_handler
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    file_handler = BatchedRotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console is None:
+        console = sys.stderr.isatty()
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"))
+        handlers.append(stream_handler)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+    pulls = logging.getLogger(PULL_LOGGER)
+    pulls.setLevel(PULL_LOG_LEVEL)
+    if PULL_LOG_SAMPLE < 1.0:
+        pulls.addFilter(SampleFilter(PULL_LOG_SAMPLE))
+    _listener = BatchingQueueListener(log_queue, *handlers)
+    _listener.start()
+    return _queue_handler
+
+
+def shutdown_logging():
+    """Drain the queue and close the file. Safe to call when logging was never set up."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    dropped = _queue_handler.dropped
+    if dropped:
+        logging.getLogger("rng").warning("Dropped %d log records because the log queue was full", dropped)
+    _listener.stop()
+    logging.getLogger().removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
@@ -0,0 +1,349 @@
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+log = logging.getLogger("rng.metrics")
+
+
+# Upper bounds in seconds, Prometheus style (an implicit +Inf bucket follows)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_FILE = os.getenv("RNG_METRICS_FILE", "bot_metrics.prom")
+METRICS_INTERVAL = float(os.getenv("RNG_METRICS_INTERVAL", "15"))
+METRICS_PORT = int(os.getenv("RNG_METRICS_PORT", "0"))  # 0 disables the HTTP endpoint
+
+_current = contextvars.ContextVar("command_timing", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class CommandTiming:
+    """Per-invocation counters, filled in by the database and HTTP hooks below."""
+
+    __slots__ = ("sql_seconds", "statements", "api_calls")
+
+    def __init__(self):
+        self.sql_seconds = 0.0
+        self.statements = 0
+        self.api_calls = 0
+
+
+class CommandStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.sql = Histogram()
+        self.statements = 0
+        self.api_calls = 0
+        self.errors = 0
+
+
+class Metrics:
+    """Process-wide registry. Updated from the event loop and the database threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.db_jobs = {"read": Histogram(), "write": Histogram()}
+        self.api_calls = 0
+        self.gauge_sources = []
+        self.started = time.time()
+
+    def record_command(self, name, elapsed, timing, failed):
+        with self.lock:
+            stats = self.commands.get(name)
+            if stats is None:
+                stats = self.commands[name] = CommandStats()
+            stats.latency.observe(elapsed)
+            stats.sql.observe(timing.sql_seconds)
+            stats.statements += timing.statements
+            stats.api_calls += timing.api_calls
+            if failed:
+                stats.errors += 1
+
+    def record_db_job(self, kind, elapsed):
+        with self.lock:
+            self.db_jobs[kind].observe(elapsed)
+
+    def add_gauge_source(self, fn):
+        # fn() returns {metric_name: number}; read every time metrics are exported
+        self.gauge_sources.append(fn)
+
+    def summary(self):
+        # One row per command for /perf and the control panel
+        with self.lock:
+            return [
+                {
+                    "command": name,
+                    "calls": stats.latency.count,
+                    "errors": stats.errors,
+                    "avg_ms": stats.latency.mean * 1000,
+                    "p95_ms": stats.latency.quantile(0.95) * 1000,
+                    "sql_ms": stats.sql.mean * 1000,
+                    "statements": stats.statements / stats.latency.count if stats.latency.count else 0.0,
+                    "api_calls": stats.api_calls / stats.latency.count if stats.latency.count else 0.0,
+                }
+                for name, stats in sorted(self.commands.items())
+            ]
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+
+        def histogram(name, help_text, label, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for value, hist in series:
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{{label}="{value}"}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {hist.count}')
+
+        def counter(name, help_text, label, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for value, number in series:
+                lines.append(f'{name}{{{label}="{value}"}} {number}')
+
+        with self.lock:
+            commands = sorted(self.commands.items())
+            histogram("rng_command_latency_seconds", "Slash command handler latency.", "command", [(n, s.latency) for n, s in commands])
+            histogram("rng_command_sql_seconds", "Time spent running SQL per slash command.", "command", [(n, s.sql) for n, s in commands])
+            counter("rng_command_sql_statements_total", "SQL statements executed by slash commands.", "command", [(n, s.statements) for n, s in commands])
+            counter("rng_command_api_calls_total", "Discord API calls made by slash commands.", "command", [(n, s.api_calls) for n, s in commands])
+            counter("rng_command_errors_total", "Slash commands that raised.", "command", [(n, s.errors) for n, s in commands])
+            histogram("rng_db_job_seconds", "Database job run time on the reader/writer threads.", "kind", sorted(self.db_jobs.items()))
+            lines.append("# TYPE rng_discord_api_calls_total counter")
+            lines.append(f"rng_discord_api_calls_total {self.api_calls}")
+        lines.append("# HELP rng_startup_seconds Time spent in each startup phase.")
+        lines.append("# TYPE rng_startup_seconds gauge")
+        for phase, seconds in startup.phases.items():
+            lines.append(f'rng_startup_seconds{{phase="{phase}"}} {seconds:.6f}')
+        lines.append("# TYPE rng_uptime_seconds gauge")
+        lines.append(f"rng_uptime_seconds {time.time() - self.started:.0f}")
+        for source in self.gauge_sources:
+            try:
+                values = source()
+            except Exception:
+                continue
+            for name, value in values.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path=METRICS_FILE):
+        # Write then rename so readers never see a half-written file
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+metrics = Metrics()
+
+
+class StartupTimer:
+    """How long each startup phase took, for tracking cold-start latency. Phases are timed back to back."""
+
+    def __init__(self):
+        self.phases = {}
+        self._last = time.perf_counter()
+        self.total = 0.0
+
+    def mark(self, phase):
+        # Time since the previous mark (the first is timed from when metrics was imported)
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self.total += now - self._last
+        self._last = now
+
+    def report(self):
+        return dict({phase: round(seconds, 3) for phase, seconds in self.phases.items()}, total=round(self.total, 3))
+
+
+startup = StartupTimer()
+
+
+# --- Hooks ---
+
+def timed_command(name, callback):
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        timing = CommandTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await callback(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current.reset(token)
+            metrics.record_command(name, time.perf_counter() - start, timing, failed)
+    return wrapper
+
+
+def instrument_tree(tree):
+    """Wrap every registered command callback with timing. Call after all commands are defined."""
+    for command in tree.walk_commands():
+        if hasattr(command, "_callback"):
+            # The command object keeps its parsed signature; only the coroutine it awaits changes
+            command._callback = timed_command(command.qualified_name, command._callback)
+
+
+def _timed_job(kind, fn, timing):
+    def job(conn, *args):
+        statements = [0]
+        if timing is not None:
+            conn.set_trace_callback(lambda _: statements.__setitem__(0, statements[0] + 1))
+        start = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if timing is not None:
+                conn.set_trace_callback(None)
+                timing.sql_seconds += elapsed
+                timing.statements += statements[0]
+            metrics.record_db_job(kind, elapsed)
+    return job
+
+
+def instrument_database(db):
+    """Time every job submitted to a db.Database and charge it to the command that submitted it."""
+    submit_read, submit_write = db.submit_read, db.submit_write
+    db.submit_read = lambda fn, *args: submit_read(_timed_job("read", fn, _current.get()), *args)
+    db.submit_write = lambda fn, *args: submit_write(_timed_job("write", fn, _current.get()), *args)
+
+
+def count_api_calls():
+    """Count Discord REST calls, including interaction responses and followups (webhook routes)."""
+    import discord.http
+    from discord.webhook import async_
+
+    def wrap(request):
+        @functools.wraps(request)
+        async def counted(*args, **kwargs):
+            metrics.api_calls += 1
+            timing = _current.get()
+            if timing is not None:
+                timing.api_calls += 1
+            return await request(*args, **kwargs)
+        return counted
+
+    discord.http.HTTPClient.request = wrap(discord.http.HTTPClient.request)
+    async_.AsyncWebhookAdapter.request = wrap(async_.AsyncWebhookAdapter.request)
+
+
+# --- Export ---
+
+async def write_metrics_periodically(path=METRICS_FILE, interval=METRICS_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(metrics.write_file, path)
+        except OSError as e:
+            log.warning("Failed to write metrics file: %s", e)
+
+
+async def _handle_scrape(reader, writer):
+    try:
+        request = await reader.readline()
+        while (await reader.readline()).strip():
+            pass  # Skip headers
+        if request.split()[1:2] in ([b"/metrics"], [b"/"]):
+            body = metrics.render().encode()
+            status = b"200 OK"
+        else:
+            body = b"not found\n"
+            status = b"404 Not Found"
+        writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                     + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (ConnectionError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(port=METRICS_PORT):
+    # Localhost only: the endpoint has no authentication
+    return await asyncio.start_server(_handle_scrape, "127.0.0.1", port)
+
+
+def read_summary(path=METRICS_FILE):
+    """Rebuild the per-command summary from a metrics file written by the bot (used by the control panel)."""
+    commands = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or "{" not in line:
+                continue
+            name, rest = line.split("{", 1)
+            labels, value = rest.rsplit("}", 1)
+            labels = dict(part.split("=", 1) for part in labels.split(","))
+            command = labels.get("command", "").strip('"')
+            if not command:
+                continue
+            stats = commands.setdefault(command, CommandStats())
+            value = float(value)
+            if name == "rng_command_latency_seconds_bucket":
+                le = labels["le"].strip('"')
+                if le != "+Inf":
+                    index = BUCKETS.index(float(le))
+                    # Buckets are cumulative in the file
+                    stats.latency.counts[index] = value - sum(stats.latency.counts[:index])
+            elif name == "rng_command_latency_seconds_count":
+                stats.latency.count = int(value)
+            elif name == "rng_command_latency_seconds_sum":
+                stats.latency.sum = value
+            elif name == "rng_command_sql_seconds_sum":
+                stats.sql.sum = value
+            elif name == "rng_command_sql_seconds_count":
+                stats.sql.count = int(value)
+            elif name == "rng_command_sql_statements_total":
+                stats.statements = int(value)
+            elif name == "rng_command_api_calls_total":
+                stats.api_calls = int(value)
+            elif name == "rng_command_errors_total":
+                stats.errors = int(value)
+    for stats in commands.values():
+        stats.latency.counts[-1] = stats.latency.count - sum(stats.latency.counts[:-1])
+    snapshot = Metrics()
+    snapshot.commands = commands
+    return snapshot.summary()
@@ -0,0 +1,271 @@
+
+"""Versioned, in-place schema migrations.
+
+init_schema() creates missing tables in their current shape; the steps here
+convert databases made by older versions. Large tables are copied in
+batches, each in its own short write transaction, while triggers mirror any
+writes to the old table into the copy, so the bot, the control panel and
+read-only tools are never locked out for longer than one batch.
+
+The bot and the control panel migrate on startup. To migrate by hand, and
+optionally VACUUM afterwards to return the freed pages to the filesystem:
+
+    python migrations.py --db rng_game.db --vacuum
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from catalogue import get_rarity_id
+from db import (
+    DB_PATH, SCHEMA_VERSION, connect, create_inventory_table, create_items_table, create_rarity_pulls_table,
+    get_schema_version, init_schema, is_legacy_schema, retry_on_busy, set_schema_version, table_columns,
+)
+from players import rescore_collection
+
+log = logging.getLogger("rng.migrations")
+
+MIGRATION_BATCH = int(os.getenv("RNG_MIGRATION_BATCH", "5000"))
+# Gap between batches so other connections get a turn at the write lock
+MIGRATION_PAUSE_MS = float(os.getenv("RNG_MIGRATION_PAUSE_MS", "5"))
+
+
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def copy_in_batches(run_write, copy_batch, batch_size, pause=MIGRATION_PAUSE_MS / 1000):
+    """Call run_write(copy_batch, cursor, batch_size) until it returns None; returns the rows copied."""
+    cursor = None
+    copied = 0
+    while True:
+        result = run_write(copy_batch, cursor, batch_size)
+        if result is None:
+            return copied
+        cursor, count = result
+        copied += count
+        time.sleep(pause)
+
+
+# --- 2: integer item and rarity ids ---
+
+# Writes from processes still running the old code land in the old tables; these mirror them into the copies.
+# Upserts take the row's current value, so they and the batch copy can run in either order.
+INVENTORY_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS inventory_v1_insert AFTER INSERT ON inventory BEGIN
+        INSERT INTO inventory_v2 (user_id, item_id, amount)
+        SELECT NEW.user_id, item_id, NEW.amount FROM items WHERE item = NEW.item
+        ON CONFLICT(user_id, item_id) DO UPDATE SET amount = excluded.amount;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS inventory_v1_update AFTER UPDATE ON inventory BEGIN
+        INSERT INTO inventory_v2 (user_id, item_id, amount)
+        SELECT NEW.user_id, item_id, NEW.amount FROM items WHERE item = NEW.item
+        ON CONFLICT(user_id, item_id) DO UPDATE SET amount = excluded.amount;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS inventory_v1_delete AFTER DELETE ON inventory BEGIN
+        DELETE FROM inventory_v2 WHERE user_id = OLD.user_id AND item_id = (SELECT item_id FROM items WHERE item = OLD.item);
+    END""",
+]
+RARITY_PULLS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS user_rarity_pulls_v1_insert AFTER INSERT ON user_rarity_pulls BEGIN
+        INSERT INTO user_rarity_pulls_v2 (user_id, rarity_id, pulls)
+        SELECT NEW.user_id, rarity_id, NEW.pulls FROM rarities WHERE name = NEW.rarity
+        ON CONFLICT(user_id, rarity_id) DO UPDATE SET pulls = excluded.pulls;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_rarity_pulls_v1_update AFTER UPDATE ON user_rarity_pulls BEGIN
+        INSERT INTO user_rarity_pulls_v2 (user_id, rarity_id, pulls)
+        SELECT NEW.user_id, rarity_id, NEW.pulls FROM rarities WHERE name = NEW.rarity
+        ON CONFLICT(user_id, rarity_id) DO UPDATE SET pulls = excluded.pulls;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_rarity_pulls_v1_delete AFTER DELETE ON user_rarity_pulls BEGIN
+        DELETE FROM user_rarity_pulls_v2 WHERE user_id = OLD.user_id AND rarity_id = (SELECT rarity_id FROM rarities WHERE name = OLD.rarity);
+    END""",
+]
+TRIGGER_NAMES = ("inventory_v1_insert", "inventory_v1_update", "inventory_v1_delete",
+                 "user_rarity_pulls_v1_insert", "user_rarity_pulls_v1_update", "user_rarity_pulls_v1_delete")
+
+
+def begin(conn):
+    # sqlite3 only opens a transaction implicitly before DML; the schema changes below must be atomic too
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def start_item_ids(conn):
+    """Give items integer ids and create the id-keyed copies of inventory and the rarity counters."""
+    begin(conn)
+    if not is_legacy_schema(conn):
+        return
+    if "item_id" not in table_columns(conn, "items"):
+        # Every rarity name in use gets an id; init_schema already added RARITY_ORDER with its tiers
+        sources = ["SELECT rarity FROM items", "SELECT rarity FROM inventory"]
+        if table_exists(conn, "user_rarity_pulls"):
+            sources.append("SELECT rarity FROM user_rarity_pulls")
+        conn.execute(f"INSERT OR IGNORE INTO rarities (name, tier) SELECT rarity, -1 FROM ({' UNION '.join(sources)})")
+        conn.execute("ALTER TABLE items RENAME TO items_v1")
+        create_items_table(conn)
+        # Keep the implicit rowids: pull_history and item_pool_versions already refer to them
+        conn.execute("""
+        INSERT INTO items (item_id, item, rarity_id, description, image)
+        SELECT o.rowid, o.item, r.rarity_id, o.description, o.image
+        FROM items_v1 o JOIN rarities r ON r.name = o.rarity
+        """)
+        conn.execute("DROP TABLE items_v1")
+    create_inventory_table(conn, "inventory_v2")
+    create_rarity_pulls_table(conn, "user_rarity_pulls_v2")
+    for statement in INVENTORY_TRIGGERS:
+        conn.execute(statement)
+    if table_exists(conn, "user_rarity_pulls"):
+        for statement in RARITY_PULLS_TRIGGERS:
+            conn.execute(statement)
+
+
+def copy_inventory_batch(conn, after, limit):
+    if not is_legacy_schema(conn):
+        return None
+    rows = conn.execute(
+        "SELECT rowid, user_id, item, rarity, amount FROM inventory WHERE rowid > ? ORDER BY rowid LIMIT ?",
+        (after or 0, limit),
+    ).fetchall()
+    if not rows:
+        return None
+    ids = dict(conn.execute("SELECT item, item_id FROM items").fetchall())
+    copied = []
+    for _, user_id, item, rarity, amount in rows:
+        if item not in ids:
+            # Removed from the pool but still owned: keep it as a retired item
+            ids[item] = conn.execute(
+                "INSERT INTO items (item, rarity_id, retired) VALUES (?, ?, 1)", (item, get_rarity_id(conn, rarity))
+            ).lastrowid
+        copied.append((user_id, ids[item], amount))
+    conn.executemany(
+        "INSERT INTO inventory_v2 (user_id, item_id, amount) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id, item_id) DO UPDATE SET amount = excluded.amount",
+        copied,
+    )
+    return rows[-1][0], len(rows)
+
+
+def copy_rarity_pulls_batch(conn, after, limit):
+    if not is_legacy_schema(conn) or not table_exists(conn, "user_rarity_pulls"):
+        return None
+    after = after or (-2 ** 63, "")
+    rows = conn.execute(
+        "SELECT user_id, rarity, pulls FROM user_rarity_pulls WHERE (user_id, rarity) > (?, ?) ORDER BY user_id, rarity LIMIT ?",
+        (after[0], after[1], limit),
+    ).fetchall()
+    if not rows:
+        return None
+    ids = dict(conn.execute("SELECT name, rarity_id FROM rarities").fetchall())
+    conn.executemany(
+        "INSERT INTO user_rarity_pulls_v2 (user_id, rarity_id, pulls) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id, rarity_id) DO UPDATE SET pulls = excluded.pulls",
+        [(user_id, ids.get(rarity) or get_rarity_id(conn, rarity), pulls) for user_id, rarity, pulls in rows],
+    )
+    return rows[-1][:2], len(rows)
+
+
+def finish_item_ids(conn):
+    """Swap the copies in for the old tables."""
+    begin(conn)
+    if not is_legacy_schema(conn):
+        return
+    for name in TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    if not table_exists(conn, "user_rarity_pulls"):
+        # Databases from before the counters existed: seed them from inventories, the best record there is
+        conn.execute("""
+        INSERT INTO user_rarity_pulls_v2 (user_id, rarity_id, pulls)
+        SELECT inv.user_id, i.rarity_id, SUM(inv.amount)
+        FROM inventory_v2 inv JOIN items i ON i.item_id = inv.item_id
+        GROUP BY inv.user_id, i.rarity_id
+        """)
+    conn.execute("DROP TABLE inventory")
+    conn.execute("ALTER TABLE inventory_v2 RENAME TO inventory")
+    conn.execute("DROP TABLE IF EXISTS user_rarity_pulls")
+    conn.execute("ALTER TABLE user_rarity_pulls_v2 RENAME TO user_rarity_pulls")
+
+
+def migrate_item_ids(run_write, batch_size):
+    run_write(start_item_ids)
+    copied = copy_in_batches(run_write, copy_inventory_batch, batch_size)
+    copied += copy_in_batches(run_write, copy_rarity_pulls_batch, batch_size)
+    run_write(finish_item_ids)
+    return copied
+
+
+def migrate_collection_scores(run_write, batch_size):
+    # Scores used to be rebuilt every minute; from now on every write keeps them current
+    run_write(rescore_collection)
+    return 0
+
+
+# (version, name, step); step(run_write, batch_size) must be safe to re-run after an interruption
+MIGRATIONS = [
+    (2, "integer item and rarity ids", migrate_item_ids),
+    (3, "incremental collection scores", migrate_collection_scores),
+]
+
+
+def migrate(run_write, batch_size=MIGRATION_BATCH):
+    """Bring the database up to SCHEMA_VERSION.
+
+    run_write(fn, *args) must run fn(conn, *args) in its own write transaction and
+    return its result (db.Database.write_sync, or the control panel's worker).
+    """
+    version = run_write(get_schema_version)
+    for target, name, step in MIGRATIONS:
+        if version >= target:
+            continue
+        log.info("Migrating database to schema version %d (%s)", target, name)
+        start = time.perf_counter()
+        rows = step(run_write, batch_size)
+        run_write(set_schema_version, target, name)
+        log.info("Schema version %d applied in %.1fs (%d rows copied)", target, time.perf_counter() - start, rows or 0)
+        version = target
+    return version
+
+
+def run_in_transaction(conn):
+    # run_write for a plain connection
+    def run_write(fn, *args):
+        def job():
+            try:
+                result = fn(conn, *args)
+                conn.commit()
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
+        return retry_on_busy(job)
+    return run_write
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the game database to the current schema.")
+    parser.add_argument("--db", default=DB_PATH, help=f"database path (default {DB_PATH})")
+    parser.add_argument("--batch", type=int, default=MIGRATION_BATCH, help="rows copied per write transaction")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards (locks the database while it runs)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    conn = connect(args.db)
+    try:
+        run_write = run_in_transaction(conn)
+        run_write(init_schema)
+        before = get_schema_version(conn)
+        after = migrate(run_write, args.batch)
+        print(f"Schema version {before} -> {after} (current is {SCHEMA_VERSION}).")
+        if args.vacuum:
+            size = os.path.getsize(args.db)
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            print(f"Vacuumed: {size / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+
+"""Writes to player data shared by the bot, the CLI, the control panel and bulk.py."""
+
+import json
+from collections import Counter
+
+from game import RARITY_POINTS
+
+INSERT_USER = "INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)"
+UPSERT_INVENTORY = (
+    "INSERT INTO inventory (user_id, item_id, amount) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id, item_id) DO UPDATE SET amount = amount + excluded.amount"
+)
+
+
+# Bumped by every admin write to player data, so the bot knows its cached pull stats may be stale
+USER_DATA_KEY = "user_data_version"
+
+UPSERT_COLLECTION_SCORE = (
+    "INSERT INTO collection_scores (user_id, score) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET score = score + excluded.score"
+)
+
+
+# --- Collection scores ---
+# Kept current by every write that changes which live items a user owns, so the
+# leaderboard only ever reads the top of the score index.
+
+def score_new_items(conn, pairs):
+    """Add points for (user_id, item_id) pairs the users do not own yet. Call before adding positive amounts."""
+    new = conn.execute("""
+        SELECT json_extract(p.value, '$[0]'), r.name
+        FROM (SELECT DISTINCT value FROM json_each(?)) p
+        JOIN items i ON i.item_id = json_extract(p.value, '$[1]')
+        JOIN rarities r ON r.rarity_id = i.rarity_id
+        WHERE NOT i.retired AND NOT EXISTS (
+            SELECT 1 FROM inventory inv
+            WHERE inv.user_id = json_extract(p.value, '$[0]') AND inv.item_id = i.item_id AND inv.amount > 0
+        )
+    """, (json.dumps(pairs),)).fetchall()
+    gained = Counter()
+    for user_id, rarity in new:
+        gained[user_id] += RARITY_POINTS.get(rarity, 1)
+    conn.executemany(UPSERT_COLLECTION_SCORE, gained.items())
+
+
+def adjust_item_score(conn, item_id, delta):
+    # Every current owner of one item gains (or loses) delta, e.g. when it is retired or changes rarity
+    if delta:
+        conn.execute("""
+            INSERT INTO collection_scores (user_id, score)
+            SELECT user_id, ? FROM inventory WHERE item_id = ? AND amount > 0
+            ON CONFLICT(user_id) DO UPDATE SET score = score + excluded.score
+        """, (delta, item_id))
+
+
+def rescore_collection(conn, user_ids=None):
+    """Recompute collection scores from inventory for these users, or for everyone."""
+    points = list(RARITY_POINTS.items())
+    values = ", ".join("(?, ?)" for _ in points)
+    params = [value for pair in points for value in pair]
+    if user_ids is None:
+        conn.execute("DELETE FROM collection_scores")
+        where = ""
+    else:
+        user_ids = json.dumps(list(user_ids))
+        conn.execute("DELETE FROM collection_scores WHERE user_id IN (SELECT value FROM json_each(?))", (user_ids,))
+        where = "AND inv.user_id IN (SELECT value FROM json_each(?))"
+        params.append(user_ids)
+    conn.execute(f"""
+        WITH points (rarity, points) AS (VALUES {values})
+        INSERT INTO collection_scores (user_id, score)
+        SELECT inv.user_id, SUM(COALESCE(p.points, 1))
+        FROM inventory inv
+        JOIN items i ON i.item_id = inv.item_id
+        JOIN rarities r ON r.rarity_id = i.rarity_id
+        LEFT JOIN points p ON p.rarity = r.name
+        WHERE inv.amount > 0 AND NOT i.retired {where}
+        GROUP BY inv.user_id
+    """, params)
+
+
+# --- Admin writes ---
+
+def get_user_data_version(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (USER_DATA_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_user_data_version(conn):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1",
+        (USER_DATA_KEY,),
+    )
+
+
+def give_item(conn, user_id, item_id, amount):
+    bump_user_data_version(conn)
+    conn.execute(INSERT_USER, (user_id, str(user_id)))
+    if amount > 0:
+        score_new_items(conn, [(user_id, item_id)])
+        conn.execute(UPSERT_INVENTORY, (user_id, item_id, amount))
+    else:
+        # Taking items away can empty a stack
+        conn.execute(UPSERT_INVENTORY, (user_id, item_id, amount))
+        rescore_collection(conn, [user_id])
+
+
+def set_pulls(conn, user_id, pulls):
+    bump_user_data_version(conn)
+    conn.execute(INSERT_USER, (user_id, str(user_id)))
+    conn.execute("UPDATE users SET pulls = ? WHERE user_id = ?", (pulls, user_id))
+
+
+def reset_user_data(conn):
+    bump_user_data_version(conn)
+    conn.execute("DELETE FROM users")
+    conn.execute("DELETE FROM inventory")
+    conn.execute("DELETE FROM user_rarity_pulls")
+    conn.execute("DELETE FROM collection_scores")
+    # pull_history is the append-only audit trail for drop rates and complaints, so it outlives resets
@@ -0,0 +1,279 @@
+
+"""Seedable, pre-drawn stream of uniforms for pulls.
+
+The stream for a seed is cut into fixed-size blocks. Block k is generated
+from (seed, k) alone, so position p = k * block_size + offset always yields
+the same uniform and a recorded pull can be replayed:
+
+    python rng.py replay --user 1234 --last 5
+
+Blocks are generated in bulk on a background thread ahead of use. Each
+block number is claimed from the database (rng_streams.next_block) before it
+is generated, so a restart with the same RNG_SEED continues the stream, and
+processes sharing a seed (the bot and a CLI batch) never draw the same block.
+A single draw never crosses a block boundary, so its uniforms sit at
+consecutive positions.
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import queue
+import random
+import secrets
+import sqlite3
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger("rng.stream")
+
+RNG_SEED = os.getenv("RNG_SEED")  # Unset: a fresh random seed (and stream) per process
+# auto: numpy-pcg64 when numpy (in requirements.txt) is installed, otherwise the much slower python-mt
+RNG_ENGINE = os.getenv("RNG_ENGINE", "auto")
+RNG_BLOCK_SIZE = int(os.getenv("RNG_BLOCK_SIZE", "65536"))
+RNG_PREFETCH_BLOCKS = int(os.getenv("RNG_PREFETCH_BLOCKS", "2"))
+# A draw gives up after waiting this long for the refill thread, e.g. while the database is failing
+RNG_DRAW_TIMEOUT = float(os.getenv("RNG_DRAW_TIMEOUT", "10"))
+REFILL_RETRY_MAX = 30.0
+
+ENGINES = ("numpy-pcg64", "python-mt")
+
+
+def resolve_engine(engine=RNG_ENGINE):
+    if engine == "auto":
+        return "numpy-pcg64" if np is not None else "python-mt"
+    if engine not in ENGINES:
+        raise ValueError(f"RNG_ENGINE must be auto or one of {', '.join(ENGINES)}")
+    if engine == "numpy-pcg64" and np is None:
+        raise RuntimeError("RNG_ENGINE=numpy-pcg64 needs numpy installed")
+    return engine
+
+
+def generate_block(engine, seed, block, block_size):
+    """The uniforms in [0, 1) for one block of a stream, as a plain list."""
+    if engine == "numpy-pcg64":
+        if np is None:
+            raise RuntimeError("this stream was drawn with numpy-pcg64; install numpy to replay it")
+        return np.random.Generator(np.random.PCG64(np.random.SeedSequence([seed, block]))).random(block_size).tolist()
+    rand = random.Random((seed << 64) | block).random
+    return [rand() for _ in range(block_size)]
+
+
+# --- Stream bookkeeping (run through Database jobs) ---
+
+def open_stream(conn, seed, engine, block_size):
+    """Return (stream_id, next_block) for this seed, creating the stream on first use."""
+    conn.execute(
+        "INSERT OR IGNORE INTO rng_streams (seed, engine, block_size, created) VALUES (?, ?, ?, ?)",
+        (seed, engine, block_size, datetime.datetime.now().isoformat()),
+    )
+    return conn.execute(
+        "SELECT stream_id, next_block FROM rng_streams WHERE seed = ? AND engine = ? AND block_size = ?",
+        (seed, engine, block_size),
+    ).fetchone()
+
+
+def claim_block(conn, stream_id):
+    # Atomic on the writer, so every process sharing the stream gets different blocks
+    return conn.execute(
+        "UPDATE rng_streams SET next_block = next_block + 1 WHERE stream_id = ? RETURNING next_block - 1", (stream_id,)
+    ).fetchone()[0]
+
+
+class UniformStream:
+    """Hands out uniforms in order together with their stream position.
+
+    claim() must durably claim the next unused block and return its number;
+    it runs on the refill thread, which retries with backoff when it fails.
+    """
+
+    def __init__(self, stream_id, seed, engine, block_size, claim, prefetch=RNG_PREFETCH_BLOCKS, timeout=RNG_DRAW_TIMEOUT):
+        self.stream_id = stream_id
+        self.seed = seed
+        self.engine = engine
+        self.block_size = block_size
+        self.claim = claim
+        self.timeout = timeout
+        self._ready = queue.Queue(maxsize=max(1, prefetch))
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._block = None
+        self._offset = 0
+        self._closed = False
+        self.error = None  # Last refill failure, cleared once a block is ready again
+        self.waits = 0  # Times a draw had to wait for the refill thread
+        self._refill = threading.Thread(target=self._refill_loop, name="rng-refill", daemon=True)
+        self._refill.start()
+
+    def _refill_loop(self):
+        delay = 0.1
+        while not self._closed:
+            try:
+                block = self.claim()
+                uniforms = generate_block(self.engine, self.seed, block, self.block_size)
+            except Exception as e:
+                # Keep going: draws time out with this error meanwhile instead of waiting forever
+                self.error = e
+                log.warning("RNG block refill failed, retrying in %.1fs: %s", delay, e)
+                time.sleep(delay)
+                delay = min(delay * 2, REFILL_RETRY_MAX)
+                continue
+            self.error = None
+            delay = 0.1
+            self._ready.put((block, uniforms))
+
+    def _next(self):
+        if self._ready.empty():
+            self.waits += 1
+        try:
+            self._block, self._buffer = self._ready.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"RNG stream has had no block ready for {self.timeout:.0f}s") from self.error
+        self._offset = 0
+
+    def take(self, count, wait=True):
+        """Return (position of the first uniform, [count uniforms]), or None if wait is false and no block is ready.
+
+        The uniforms always come from one block, so their positions are consecutive; the rest of a
+        block too short for the request is skipped.
+        """
+        if count > self.block_size:
+            raise ValueError(f"at most {self.block_size} uniforms can be taken at once")
+        # Without wait, don't queue behind a caller that holds the lock while it waits for a block
+        if not self._lock.acquire(blocking=wait):
+            return None
+        try:
+            if len(self._buffer) - self._offset < count:
+                if not wait and self._ready.empty():
+                    return None
+                self._next()
+            start = self._block * self.block_size + self._offset
+            out = self._buffer[self._offset:self._offset + count]
+            self._offset += count
+            return start, out
+        finally:
+            self._lock.release()
+
+    def position(self):
+        with self._lock:
+            return (self._block * self.block_size + self._offset) if self._block is not None else None
+
+    def close(self):
+        self._closed = True
+        # Unblock the refill thread if it is waiting for room
+        try:
+            while True:
+                self._ready.get_nowait()
+        except queue.Empty:
+            pass
+
+
+def start_stream(db, seed=RNG_SEED, engine=RNG_ENGINE, block_size=RNG_BLOCK_SIZE):
+    """Open (or resume) the deployment's stream through a db.Database and start prefetching."""
+    engine = resolve_engine(engine)
+    seed = int(seed) if seed not in (None, "") else secrets.randbits(63)
+    stream_id, next_block = db.write_sync(open_stream, seed, engine, block_size)
+    log.info("RNG stream %d (%s, block %d) starting at block %d", stream_id, engine, block_size, next_block)
+    return UniformStream(stream_id, seed, engine, block_size, lambda: db.write_sync(claim_block, stream_id))
+
+
+def draw_items(sampler, stream, count, wait=True):
+    """Draw count entries from an AliasSampler using the stream; returns (stream_id, first position, draws).
+
+    With wait false, returns None instead of waiting for the refill thread.
+    """
+    taken = stream.take(count, wait)
+    if taken is None:
+        return None
+    start, uniforms = taken
+    return stream.stream_id, start, sampler.draw_many(count, iter(uniforms).__next__)
+
+
+async def draw_items_async(sampler, stream, count):
+    """draw_items for the event loop: draws inline when a block is ready, otherwise waits on a worker thread."""
+    drawn = draw_items(sampler, stream, count, wait=False)
+    if drawn is None:
+        drawn = await asyncio.to_thread(draw_items, sampler, stream, count)
+    return drawn
+
+
+# --- Replay ---
+
+def uniform_at(engine, seed, block_size, position):
+    block, offset = divmod(position, block_size)
+    return generate_block(engine, seed, block, block_size)[offset]
+
+
+def replay_pulls(conn, weights, user_id, last=10):
+    """Recompute a user's most recent recorded pulls and compare them with what was stored."""
+    from catalogue import build_sampler, load_pool_version
+
+    rows = conn.execute(
+        "SELECT h.rowid, h.ts, h.item_id, h.pool_version, h.rng_pos, s.seed, s.engine, s.block_size "
+        "FROM pull_history h LEFT JOIN rng_streams s ON s.stream_id = h.stream_id "
+        "WHERE h.user_id = ? ORDER BY h.ts DESC, h.rowid DESC LIMIT ?",
+        (user_id, last),
+    ).fetchall()
+    samplers = {}
+    blocks = {}
+    results = []
+    for rowid, ts, item_id, version, pos, seed, engine, block_size in reversed(rows):
+        result = {"row": rowid, "ts": ts, "pool_version": version, "position": pos, "recorded_item_id": item_id}
+        if version not in samplers:
+            pool = load_pool_version(conn, version)
+            samplers[version] = (build_sampler(sorted((item, rarity) for item, rarity, _ in pool), weights),
+                                 {item: item_id for item, _, item_id in pool}) if pool else None
+        if pos is None or seed is None:
+            result["status"] = "not replayable (drawn before RNG streams)"
+        elif samplers[version] is None:
+            result["status"] = f"not replayable (pool version {version} was not recorded)"
+        else:
+            sampler, ids = samplers[version]
+            block, offset = divmod(pos, block_size)
+            key = (engine, seed, block_size, block)
+            if key not in blocks:
+                blocks[key] = generate_block(engine, seed, block, block_size)
+            u = blocks[key][offset]
+            item, rarity = sampler.entries[sampler.index_from_uniform(u)]
+            result.update(uniform=u, replayed_item=item, rarity=rarity,
+                          status="match" if ids.get(item) == item_id else "MISMATCH")
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded pulls from the RNG stream.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay = sub.add_parser("replay", help="recompute a user's recent pulls and check them against pull_history")
+    replay.add_argument("--user", type=int, required=True, help="Discord user id")
+    replay.add_argument("--last", type=int, default=10, help="how many of the most recent pulls (default 10)")
+    replay.add_argument("--db", default=None, help="database path (default RNG_DB_PATH or rng_game.db)")
+    args = parser.parse_args()
+
+    from db import DB_PATH
+    from game import RARITY_WEIGHTS
+
+    conn = sqlite3.connect(f"file:{args.db or DB_PATH}?mode=ro", uri=True)
+    try:
+        results = replay_pulls(conn, RARITY_WEIGHTS, args.user, args.last)
+    finally:
+        conn.close()
+    if not results:
+        print("No recorded pulls for that user.")
+    for r in results:
+        ts = datetime.datetime.fromtimestamp(r["ts"] / 1000).isoformat(sep=" ", timespec="seconds")
+        if "uniform" in r:
+            print(f"#{r['row']} {ts} v{r['pool_version']} pos {r['position']} u={r['uniform']:.12f} -> {r['replayed_item']} ({r['rarity']}): {r['status']}")
+        else:
+            print(f"#{r['row']} {ts} v{r['pool_version']}: {r['status']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+
+import random
+
+
+class AliasSampler:
+    """Weighted sampler using Vose's alias method: O(n) build, O(1) draws."""
+
+    def __init__(self, entries, weights):
+        self.entries = list(entries)
+        weights = [float(w) for w in weights]
+        n = len(self.entries)
+        if n == 0 or n != len(weights):
+            raise ValueError("sampler needs one weight per entry and at least one entry")
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("sampler weights must sum to a positive value")
+        self.total_weight = total
+        self.weights = weights
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Whatever is left over is 1.0 up to float rounding
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def index_from_uniform(self, u):
+        # One uniform in [0, 1) picks both the column and the coin flip
+        x = u * len(self.entries)
+        i = int(x)
+        if i >= len(self.entries):
+            i = len(self.entries) - 1
+        return i if (x - i) < self.prob[i] else self.alias[i]
+
+    def draw(self, rand=random.random):
+        return self.entries[self.index_from_uniform(rand())]
+
+    def draw_many(self, count, rand=random.random):
+        entries = self.entries
+        pick = self.index_from_uniform
+        return [entries[pick(rand())] for _ in range(count)]
+
+    def probabilities(self):
+        return {entry: w / self.total_weight for entry, w in zip(self.entries, self.weights)}
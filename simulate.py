@@ -0,0 +1,254 @@
+
+"""Offline Monte Carlo simulator for the item pool.
+
+Reads the live items table, builds the same alias table the bot draws from
+and reports per-item odds, how many pulls players need for each achievement
+and each rarity tier, and a chi-square check of the live sampler, e.g.
+
+    python simulate.py --pulls 10000000 --players 100000 --workers 4
+
+NumPy is in requirements.txt; without it everything still runs, just much
+more slowly, so use smaller --pulls/--players.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from catalogue import ItemCatalogue
+from db import DB_PATH
+from game import ACHIEVEMENTS, RARITY_ORDER, RARITY_STATS, RARITY_WEIGHTS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BATCH = 1_000_000  # Draws per vectorised batch
+PLAYER_BATCH = 500  # Players simulated together in the pulls-to-X simulation
+
+
+def load_snapshot(path):
+    # Read-only: the simulator must never create or modify the bot's database
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return ItemCatalogue(RARITY_WEIGHTS).reload(conn)
+    finally:
+        conn.close()
+
+
+# --- Vectorised draws (must stay equivalent to AliasSampler.index_from_uniform) ---
+
+def draw_indexes(rng, prob, alias, size):
+    x = rng.random(size) * len(prob)
+    i = np.minimum(x.astype(np.int64), len(prob) - 1)
+    return np.where(x - i < prob[i], i, alias[i])
+
+
+def count_draws(task):
+    """Worker: histogram of `pulls` draws over the alias table."""
+    prob, alias, pulls, seed = task
+    n = len(prob)
+    if np is None:
+        rng = random.Random(seed)
+        counts = [0] * n
+        for _ in range(pulls):
+            x = rng.random() * n
+            i = min(int(x), n - 1)
+            counts[i if x - i < prob[i] else alias[i]] += 1
+        return counts
+    rng = np.random.default_rng(seed)
+    prob, alias = np.asarray(prob), np.asarray(alias)
+    counts = np.zeros(n, dtype=np.int64)
+    for start in range(0, pulls, BATCH):
+        counts += np.bincount(draw_indexes(rng, prob, alias, min(BATCH, pulls - start)), minlength=n)
+    return counts.tolist()
+
+
+def first_hits(task):
+    """Worker: for each player, the pull number on which every target first became true.
+
+    targets are (name, kind, key) with kind "achievement" (key indexes ACHIEVEMENTS)
+    or "rarity" (key is the tier; any rarer item counts too). Returns {name: [pulls or None, ...]}.
+    """
+    prob, alias, rarities, targets, players, max_pulls, seed = task
+    tiers = [RARITY_ORDER.index(r) if r in RARITY_ORDER else -1 for r in rarities]
+    stat_names = sorted(set(RARITY_STATS.values()))
+    results = {name: [] for name, _, _ in targets}
+    if np is None:
+        rng = random.Random(seed)
+        n = len(prob)
+        for _ in range(players):
+            stats = dict.fromkeys(stat_names, 0)
+            stats["pulls"] = 0
+            hit = {}
+            best_tier = -1
+            for pull in range(1, max_pulls + 1):
+                x = rng.random() * n
+                i = min(int(x), n - 1)
+                index = i if x - i < prob[i] else alias[i]
+                stats["pulls"] += 1
+                stat = RARITY_STATS.get(rarities[index])
+                if stat:
+                    stats[stat] += 1
+                best_tier = max(best_tier, tiers[index])
+                for name, kind, key in targets:
+                    if name not in hit and (ACHIEVEMENTS[key][3](stats) if kind == "achievement" else best_tier >= key):
+                        hit[name] = pull
+                if len(hit) == len(targets):
+                    break
+            for name in results:
+                results[name].append(hit.get(name))
+        return results
+    rng = np.random.default_rng(seed)
+    prob, alias, tiers = np.asarray(prob), np.asarray(alias), np.asarray(tiers)
+    stat_of_item = {stat: np.array([RARITY_STATS.get(r) == stat for r in rarities]) for stat in stat_names}
+    for start in range(0, players, PLAYER_BATCH):
+        size = min(PLAYER_BATCH, players - start)
+        draws = draw_indexes(rng, prob, alias, (size, max_pulls))
+        # Running totals per player and pull; the conditions are plain comparisons so they work on arrays
+        stats = {stat: np.cumsum(mask[draws], axis=1) for stat, mask in stat_of_item.items()}
+        stats["pulls"] = np.broadcast_to(np.arange(1, max_pulls + 1), (size, max_pulls))
+        best_tier = np.maximum.accumulate(tiers[draws], axis=1)
+        for name, kind, key in targets:
+            reached = np.asarray(ACHIEVEMENTS[key][3](stats) if kind == "achievement" else best_tier >= key)
+            reached = np.broadcast_to(reached, (size, max_pulls))
+            first = np.argmax(reached, axis=1) + 1
+            results[name].extend(int(p) if ok else None for p, ok in zip(first, reached.any(axis=1)))
+    return results
+
+
+# --- Statistics ---
+
+def chi_square(observed, expected_probs):
+    total = sum(observed)
+    stat = 0.0
+    for seen, p in zip(observed, expected_probs):
+        want = p * total
+        if want:
+            stat += (seen - want) ** 2 / want
+    return stat
+
+
+def chi_square_p_value(stat, df):
+    # Wilson-Hilferty normal approximation of the upper tail; good for df >= 3
+    if df <= 0:
+        return 1.0
+    z = ((stat / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def distribution(values, max_pulls):
+    hits = sorted(v for v in values if v is not None)
+    summary = {"players": len(values), "never_within_cap": len(values) - len(hits), "cap": max_pulls}
+    if hits:
+        def pct(q):
+            return hits[min(len(hits) - 1, int(q * len(hits)))]
+        summary.update(mean=round(sum(hits) / len(hits), 2), p50=pct(0.5), p90=pct(0.9), p99=pct(0.99), max=hits[-1])
+    return summary
+
+
+def split(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts) if base or i < extra]
+
+
+def run_tasks(fn, tasks, workers):
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fn, tasks))
+    return [fn(task) for task in tasks]
+
+
+def simulate(snapshot, pulls, players, max_pulls, check_pulls, workers, seed):
+    sampler = snapshot.sampler
+    entries = sampler.entries
+    prob, alias = sampler.prob, sampler.alias
+    seeds = random.Random(seed)
+    report = {
+        "pool_version": snapshot.version,
+        "items": len(entries),
+        "engine": "numpy" if np is not None else "python",
+        "workers": workers,
+    }
+
+    # Per-item odds: exact from the weights, and observed over `pulls` simulated draws
+    start = time.perf_counter()
+    chunks = run_tasks(count_draws, [(prob, alias, part, seeds.getrandbits(63)) for part in split(pulls, workers)], workers)
+    counts = [sum(column) for column in zip(*chunks)]
+    expected = [sampler.weights[i] / sampler.total_weight for i in range(len(entries))]
+    report["pulls"] = pulls
+    report["per_item"] = [
+        {"item": item, "rarity": rarity, "expected": round(p, 6), "simulated": round(c / pulls, 6) if pulls else None, "one_in": round(1 / p, 1)}
+        for (item, rarity), p, c in sorted(zip(entries, expected, counts), key=lambda row: -row[1])
+    ]
+    by_rarity = {}
+    for (_, rarity), p in zip(entries, expected):
+        by_rarity[rarity] = by_rarity.get(rarity, 0.0) + p
+    report["per_rarity"] = {rarity: round(p, 6) for rarity, p in sorted(by_rarity.items(), key=lambda kv: RARITY_ORDER.index(kv[0]) if kv[0] in RARITY_ORDER else -1)}
+    report["draw_seconds"] = round(time.perf_counter() - start, 3)
+
+    # Pulls until each achievement unlocks and until the first item of each tier (or rarer)
+    start = time.perf_counter()
+    targets = [(aid, "achievement", index) for index, (aid, _, _, _) in enumerate(ACHIEVEMENTS)]
+    pool_tiers = sorted({RARITY_ORDER.index(r) for _, r in entries if r in RARITY_ORDER})
+    targets += [(f"first_{RARITY_ORDER[tier]}_or_rarer", "rarity", tier) for tier in pool_tiers if tier > 0]
+    rarities = [rarity for _, rarity in entries]
+    tasks = [(prob, alias, rarities, targets, part, max_pulls, seeds.getrandbits(63)) for part in split(players, workers)]
+    hits = {name: [] for name, _, _ in targets}
+    for chunk in run_tasks(first_hits, tasks, workers):
+        for name, values in chunk.items():
+            hits[name].extend(values)
+    report["pulls_to"] = {name: distribution(values, max_pulls) for name, values in hits.items()}
+    report["pulls_to_seconds"] = round(time.perf_counter() - start, 3)
+
+    # Chi-square of the live sampler (the code path behind /pull) against the weights
+    start = time.perf_counter()
+    live = dict.fromkeys(entries, 0)
+    rand = random.Random(seeds.getrandbits(63)).random
+    for begin in range(0, check_pulls, 100_000):
+        for entry in sampler.draw_many(min(100_000, check_pulls - begin), rand):
+            live[entry] += 1
+    stat = chi_square([live[entry] for entry in entries], expected)
+    df = len(entries) - 1
+    report["live_sampler_check"] = {
+        "pulls": check_pulls,
+        "chi_square": round(stat, 3),
+        "df": df,
+        "p_value": round(chi_square_p_value(stat, df), 4),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate pulls on the current item pool.")
+    parser.add_argument("--db", default=DB_PATH, help=f"database to read the item pool from (default {DB_PATH})")
+    parser.add_argument("--pulls", type=int, default=10_000_000 if np is not None else 1_000_000, help="draws for the per-item odds")
+    parser.add_argument("--players", type=int, default=100_000 if np is not None else 10_000, help="simulated players for pulls-to-X")
+    parser.add_argument("--max-pulls", type=int, default=2_000, help="give up on a player after this many pulls")
+    parser.add_argument("--check-pulls", type=int, default=1_000_000, help="draws from the live sampler for the chi-square check")
+    parser.add_argument("--workers", type=int, default=1, help=f"worker processes (this machine has {os.cpu_count()} CPUs)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for a reproducible run")
+    parser.add_argument("-o", "--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.db)
+    if snapshot.sampler is None:
+        parser.error("the item pool is empty")
+    report = simulate(snapshot, args.pulls, args.players, args.max_pulls, args.check_pulls, max(1, args.workers), args.seed)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
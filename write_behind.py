@@ -0,0 +1,129 @@
+
+import asyncio
+import logging
+import time
+
+log = logging.getLogger("rng.write_behind")
+
+
+class WriteBehindQueue:
+    """Group-commit queue in front of Database writes.
+
+    Events are buffered in memory and handed to flush_fn(conn, events) on the
+    writer thread as one transaction, either once window seconds have passed
+    since the first buffered event or as soon as max_batch events are waiting.
+    Anything still buffered is flushed by close().
+    """
+
+    def __init__(self, db, flush_fn, window=0.05, max_batch=500):
+        self.db = db
+        self.flush_fn = flush_fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._flushing = []  # The batch being written right now
+        self._lock = None
+        self._has_events = None
+        self._full = None
+        self._task = None
+        self._closing = False
+        # Counters
+        self.in_flight = 0
+        self.flushes = 0
+        self.events_flushed = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def queued(self):
+        """Events not committed yet: the batch being written, then the ones waiting."""
+        return self._flushing + self._pending
+
+    def start(self):
+        self._lock = asyncio.Lock()
+        self._has_events = asyncio.Event()
+        self._full = asyncio.Event()
+        if self._pending:
+            self._has_events.set()
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, event):
+        self._pending.append(event)
+        if self._has_events is not None:
+            self._has_events.set()
+            if len(self._pending) >= self.max_batch:
+                self._full.set()
+
+    async def _run(self):
+        while not self._closing:
+            await self._has_events.wait()
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception as e:
+                log.warning("Write-behind flush failed, will retry: %s", e)
+
+    async def flush(self):
+        if self._lock is None:
+            # Not started (CLI, tests): write straight through
+            events, self._pending = self._pending, []
+            if events:
+                self.db.write_sync(self.flush_fn, events)
+            return
+        async with self._lock:
+            events, self._pending = self._pending, []
+            self._has_events.clear()
+            self._full.clear()
+            if not events:
+                return
+            start = time.perf_counter()
+            self.in_flight = len(events)
+            self._flushing = events
+            try:
+                await self.db.write(self.flush_fn, events)
+            except Exception:
+                # Keep ordering: failed events go back in front of anything queued meanwhile
+                self._pending[:0] = events
+                self._has_events.set()
+                self.flush_errors += 1
+                raise
+            finally:
+                self.in_flight = 0
+                self._flushing = []
+            elapsed = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.events_flushed += len(events)
+            self.last_flush_ms = elapsed
+            self.total_flush_ms += elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+    async def close(self):
+        # Let the flusher finish its current batch rather than cancelling it mid-write
+        if self._task is not None:
+            self._closing = True
+            self._has_events.set()
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth,
+            "in_flight": self.in_flight,
+            "flushes": self.flushes,
+            "events_flushed": self.events_flushed,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }